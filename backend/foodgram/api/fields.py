@@ -0,0 +1,99 @@
+import os
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.uploadedfile import UploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework import serializers
+
+from core.constants import IMAGE_VARIANTS
+from core.images import get_variants
+
+
+def get_objects_in_bulk(queryset, pks, message):
+    """
+    Вспомогательная функция: получение объектов по списку pk.
+
+    Все объекты загружаются одним запросом id__in; если каких-то нет,
+    вызывается одна ошибка валидации со списком всех ненайденных pk.
+    """
+    objects = queryset.in_bulk(set(pks))
+    missing = [str(pk) for pk in dict.fromkeys(pks) if pk not in objects]
+    if missing:
+        raise serializers.ValidationError(message.format(', '.join(missing)))
+    return [objects[pk] for pk in pks]
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """
+    Поле списка связанных объектов, проверяемого одним запросом.
+
+    В отличие от PrimaryKeyRelatedField(many=True), который выполняет
+    запрос для каждого элемента, все pk проверяются вместе
+    (get_objects_in_bulk).
+    """
+
+    default_error_messages = {
+        'does_not_exist': 'Объекты с id {} не существуют.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        queryset = self.child_relation.get_queryset()
+        pk_field = queryset.model._meta.pk
+        pks = []
+        for item in data:
+            try:
+                pks.append(pk_field.to_python(item))
+            except DjangoValidationError:
+                self.child_relation.fail('incorrect_type',
+                                         data_type=type(item).__name__)
+        return get_objects_in_bulk(queryset, pks,
+                                   self.error_messages['does_not_exist'])
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    Поле с адресами вариантов изображения (core.images).
+
+    Пока варианты не созданы, для всех размеров отдается адрес
+    исходного изображения.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        image = getattr(instance, self.image_field)
+        if not image:
+            return None
+        variants = get_variants(instance, self.image_field)
+        request = self.context.get('request')
+        result = {}
+        for variant in IMAGE_VARIANTS:
+            name = variants.get(variant)
+            url = image.storage.url(name) if name else image.url
+            result[variant] = (request.build_absolute_uri(url)
+                               if request else url)
+        return result
+
+
+class Base64OrUploadedImageField(Base64ImageField):
+    """
+    Картинка в base64 или файл, загруженный через multipart/form-data.
+
+    Загруженный файл проверяется как в ImageField и, как и картинка
+    в base64, получает случайное имя.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, UploadedFile):
+            return super().to_internal_value(data)
+        _, extension = os.path.splitext(data.name)
+        data.name = self.get_file_name(data) + extension.lower()
+        return serializers.ImageField.to_internal_value(self, data)
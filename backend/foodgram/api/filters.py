@@ -1,31 +1,72 @@
-from rest_framework.filters import SearchFilter
+from django.db.models import Exists, F, OuterRef, Q
 from django_filters import rest_framework as filters
 
+from core.search import search_recipes
 from recipes.models import Tag, Recipe
 
 
-class IngredientSearchFilter(SearchFilter):
-    """Кастомный фильтр для ингредиентов."""
-
-    search_param = 'name'
-
-
 class RecipeFilter(filters.FilterSet):
     """Кастомный фильтр для рецептов."""
 
     tags = filters.ModelMultipleChoiceFilter(field_name='tags__slug',
                                              queryset=Tag.objects.all(),
-                                             to_field_name='slug')
+                                             to_field_name='slug',
+                                             method='get_tags')
+    tags_all = filters.ModelMultipleChoiceFilter(field_name='tags__slug',
+                                                 queryset=Tag.objects.all(),
+                                                 to_field_name='slug',
+                                                 method='get_tags_all')
     is_favorited = filters.BooleanFilter(
         method='get_is_favorited'
     )
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.ChoiceFilter(choices=(('popular', 'Популярные'),),
+                                    method='get_ordering')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'tags_all', 'is_favorited',
+                  'is_in_shopping_cart', 'search', 'ordering')
+
+    def get_tags(self, queryset, field_name, tags):
+        """
+        Фильтрация рецептов, у которых есть хотя бы один из тегов.
+
+        Проверка идет по Recipe.tags_mask без соединения с таблицей
+        связей, поэтому рецепты не дублируются и DISTINCT не нужен.
+        Теги вне маски проверяются одним подзапросом EXISTS.
+        """
+        if not tags:
+            return queryset
+        mask = sum(tag.bit for tag in tags)
+        rest = [tag.pk for tag in tags if not tag.bit]
+        queryset = queryset.alias(
+            tags_any=F('tags_mask').bitand(mask),
+            tags_rest=Exists(Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'), tag_id__in=rest
+            ))
+        )
+        return queryset.filter(Q(tags_any__gt=0) | Q(tags_rest=True))
+
+    def get_tags_all(self, queryset, field_name, tags):
+        """Фильтрация рецептов, у которых есть все выбранные теги."""
+        if not tags:
+            return queryset
+        mask = sum(tag.bit for tag in tags)
+        queryset = queryset.alias(
+            tags_every=F('tags_mask').bitand(mask)
+        ).filter(tags_every=mask)
+        for tag in tags:
+            if not tag.bit:
+                queryset = queryset.filter(Exists(
+                    Recipe.tags.through.objects.filter(
+                        recipe_id=OuterRef('pk'), tag_id=tag.pk
+                    )
+                ))
+        return queryset
 
     def get_is_favorited(self, queryset, field_name, value):
         """Фильтрация рецептов по критерию избранности."""
@@ -40,3 +81,17 @@ class RecipeFilter(filters.FilterSet):
         if value and user.is_authenticated:
             return queryset.filter(shoppingcarts__user=user)
         return queryset
+
+    def get_search(self, queryset, field_name, value):
+        """Поиск рецептов по названию и описанию."""
+        return search_recipes(queryset, value)
+
+    def get_ordering(self, queryset, field_name, value):
+        """
+        Сортировка рецептов по рейтингу из таблицы RecipeRanking.
+
+        Рейтинг рассчитывается заранее командой compute_rankings;
+        рецепты без рейтинга идут в конце по дате публикации.
+        """
+        return queryset.order_by(F('ranking__popular').desc(nulls_last=True),
+                                 '-pub_date')
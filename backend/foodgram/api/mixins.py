@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from core.cache import get_version, make_key
+from core.concurrency import asgi_view
+
+
+class ASGIViewMixin:
+    """
+    Обработка чтения в пуле потоков в режиме ASGI.
+
+    Представление оборачивается адаптером core.concurrency.asgi_view;
+    в режиме WSGI поведение не меняется.
+    """
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        return asgi_view(super().as_view(*args, **kwargs))
+
+
+class AnonymousCacheMixin:
+    """
+    Кэширование ответов list и retrieve для анонимных пользователей.
+
+    Ответы анонимным пользователям не зависят от пользователя, поэтому
+    данные сериализатора кэшируются по нормализованным параметрам запроса
+    из cache_query_params. Версия пространства cache_namespace меняется
+    сигналами моделей (recipes.signals).
+    """
+
+    cache_namespace = None
+    cache_query_params = ()
+
+    def get_cache_key(self, request):
+        params = tuple(
+            (param, tuple(sorted(request.query_params.getlist(param))))
+            for param in self.cache_query_params
+            if param in request.query_params
+        )
+        return make_key(
+            f'response:{self.cache_namespace}',
+            get_version(self.cache_namespace),
+            request.build_absolute_uri('/'),
+            self.action,
+            tuple(sorted(self.kwargs.items())),
+            params
+        )
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        key = self.get_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(super().list, request,
+                                        *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(super().retrieve, request,
+                                        *args, **kwargs)
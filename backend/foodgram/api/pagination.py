@@ -1,10 +1,279 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.core.exceptions import EmptyResultSet
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from core.cache import make_key
+from core.concurrency import can_run_concurrently, run_concurrently
+from core.constants import COUNT_ESTIMATE_THRESHOLD, PAGE_SIZE
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Пагинатор с кэшированным числом объектов.
+
+    Без фильтров в PostgreSQL число строк берется из оценки планировщика
+    (pg_class.reltuples), если таблица достаточно большая. В остальных
+    случаях результат COUNT(*) кэшируется на COUNT_CACHE_TIMEOUT секунд
+    по тексту SQL-запроса, в который входят все фильтры и пользователь.
+    Атрибут count_exact показывает, посчитано ли число только что;
+    приблизительное число не ограничивает номер страницы.
+    """
+
+    count_exact = True
+
+    def get_estimate(self):
+        if connection.vendor != 'postgresql' or self.object_list.query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                (self.object_list.model._meta.db_table,)
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < COUNT_ESTIMATE_THRESHOLD:
+            return None
+        return row[0]
+
+    @cached_property
+    def count_key(self):
+        try:
+            return make_key('count', str(self.object_list.query))
+        except EmptyResultSet:
+            return None
+
+    def get_fast_count(self):
+        """Число объектов без COUNT(*): оценка или значение из кэша."""
+        if self.count_key is None:
+            return 0
+        count = self.get_estimate()
+        if count is None:
+            count = cache.get(self.count_key)
+        if count is not None:
+            self.count_exact = False
+        return count
+
+    def get_exact_count(self):
+        count = Paginator.count.func(self)
+        cache.set(self.count_key, count, settings.COUNT_CACHE_TIMEOUT)
+        return count
+
+    @cached_property
+    def count(self):
+        count = self.get_fast_count()
+        if count is None:
+            count = self.get_exact_count()
+        return count
+
+    def page(self, number):
+        """
+        Страница с номером number.
+
+        Если число объектов неизвестно заранее, COUNT(*) и выборка
+        страницы выполняются параллельно (core.concurrency).
+        """
+        if 'count' not in self.__dict__:
+            count = self.get_fast_count()
+            if (count is None and can_run_concurrently()
+                    and not self.orphans):
+                return self.get_concurrent_page(number)
+            self.count = (count if count is not None
+                          else self.get_exact_count())
+        if not self.count_exact and not self.orphans:
+            return self.get_inexact_page(number)
+        return super().page(number)
+
+    def get_inexact_page(self, number):
+        """
+        Страница при приблизительном числе объектов.
 
-from core.constants import PAGE_SIZE
+        Оценка или значение из кэша могут отличаться от настоящего числа
+        объектов, поэтому номер страницы не сравнивается с num_pages:
+        выбирается на один объект больше страницы. Если следующей
+        страницы нет, число объектов становится точным и обновляется
+        в кэше, иначе оно увеличивается до фактически найденного.
+        """
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(_('That page number is not an integer'))
+        if number < 1:
+            raise EmptyPage(_('That page number is less than 1'))
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom:bottom + self.per_page
+                                            + 1])
+        if not object_list and number > 1:
+            raise EmptyPage(_('That page contains no results'))
+        if len(object_list) > self.per_page:
+            self.count = max(self.count, bottom + len(object_list))
+        else:
+            self.count = bottom + len(object_list)
+            self.count_exact = True
+            if self.count_key is not None:
+                cache.set(self.count_key, self.count,
+                          settings.COUNT_CACHE_TIMEOUT)
+        return self._get_page(object_list[:self.per_page], number, self)
+
+    def get_concurrent_page(self, number):
+        try:
+            bottom = (int(number) - 1) * self.per_page
+        except (TypeError, ValueError):
+            bottom = -1
+        if bottom < 0:
+            self.count = self.get_exact_count()
+            return super().page(number)
+        self.count, object_list = run_concurrently(
+            self.get_exact_count,
+            lambda: list(self.object_list[bottom:bottom + self.per_page])
+        )
+        return self._get_page(object_list, self.validate_number(number),
+                              self)
 
 
 class UserRecipePagination(PageNumberPagination):
-    """Кастомный класс пагинации."""
+    """
+    Кастомный класс пагинации.
+
+    По умолчанию используется постраничная пагинация с кэшированным
+    числом объектов (CachedCountPaginator). Если в запросе передан
+    параметр cursor (для первой страницы - пустой), включается
+    keyset-пагинация по полям cursor_ordering view: без COUNT(*) и OFFSET,
+    время выборки не растет с глубиной прокрутки. Метод view
+    get_cursor_filter(position, limit), если он есть, добавляет условие,
+    зависящее от позиции курсора. Курсор несовместим с сортировкой
+    queryset, которая не является началом cursor_ordering (рейтинг,
+    релевантность поиска): такой запрос получает ответ 400.
+    """
 
+    django_paginator_class = CachedCountPaginator
     page_size_query_param = 'limit'
     page_size = PAGE_SIZE
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+    ordered_cursor_message = ('Курсор не поддерживается при сортировке '
+                              'по рейтингу или релевантности.')
+
+    cursor_only = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = (self.cursor_only or self.cursor_query_param
+                            in request.query_params)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.ordering = getattr(view, 'cursor_ordering',
+                                self.cursor_ordering)
+        order_by = tuple(queryset.query.order_by)
+        if order_by != tuple(self.ordering[:len(order_by)]):
+            raise ValidationError({
+                self.cursor_query_param: self.ordered_cursor_message
+            })
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position))
+        if hasattr(view, 'get_cursor_filter'):
+            queryset = queryset.filter(
+                view.get_cursor_filter(position, page_size + 1)
+            )
+        page = list(queryset.order_by(*self.ordering)[:page_size + 1])
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_position = [getattr(page[-1], field.lstrip('-'))
+                                  for field in self.ordering]
+        return page
+
+    def get_keyset_filter(self, position):
+        """
+        Условие выборки записей после позиции курсора.
+
+        Для ordering (a, b) это a < x OR (a = x AND b < y); условие
+        a <= x дублируется отдельно, чтобы планировщик мог использовать
+        индекс по первому полю.
+        """
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{field.lstrip("-")}__{lookup}': position[index]})
+            for previous, value in zip(self.ordering[:index], position):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        first = self.ordering[0]
+        lookup = 'lte' if first.startswith('-') else 'gte'
+        return condition & Q(**{f'{first.lstrip("-")}__{lookup}':
+                                position[0]})
+
+    def decode_cursor(self, request, model):
+        """
+        Позиция курсора из параметра запроса.
+
+        Значения приводятся к типам полей ordering модели model,
+        неверный курсор дает ответ 404.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(encoded.encode()))
+            if (not isinstance(position, list)
+                    or len(position) != len(self.ordering)
+                    or None in position):
+                raise ValueError
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        values = [value.isoformat() if hasattr(value, 'isoformat')
+                  else value for value in position]
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(),
+                                 self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return Response(OrderedDict((
+                ('count', self.page.paginator.count),
+                ('count_exact', self.page.paginator.count_exact),
+                ('next', self.get_next_link()),
+                ('previous', self.get_previous_link()),
+                ('results', data),
+            )))
+        return Response(OrderedDict((
+            ('next', self.get_next_link()),
+            ('previous', None),
+            ('results', data),
+        )))
+
+
+class FeedPagination(UserRecipePagination):
+    """Пагинация ленты подписок: всегда keyset, без COUNT(*)."""
+
+    cursor_only = True
@@ -0,0 +1,47 @@
+import json
+
+from django.utils.datastructures import MultiValueDict
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+
+class MultiPartData(dict):
+    """
+    Данные multipart-запроса в виде обычного словаря.
+
+    DRF объединяет данные с файлами через copy() и update(); для файлов
+    берется последнее значение поля, как и для остальных полей.
+    """
+
+    def copy(self):
+        return type(self)(self)
+
+    def update(self, other):
+        if isinstance(other, MultiValueDict):
+            other = other.items()
+        super().update(other)
+
+
+class MultiPartJSONParser(MultiPartParser):
+    """
+    Парсер multipart/form-data для данных с вложенными полями.
+
+    Файлы принимаются обработчиками загрузки Django (небольшие - в память,
+    остальные - во временный файл) без кодирования в base64. Поля из
+    multipart_json_fields view (например, ingredients и tags) передаются
+    строками JSON, остальные поля - как есть.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        result = super().parse(stream, media_type, parser_context)
+        view = (parser_context or {}).get('view')
+        json_fields = getattr(view, 'multipart_json_fields', ())
+        data = MultiPartData()
+        for key, value in result.data.items():
+            if key in json_fields:
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    raise ParseError(f'Поле {key} должно быть строкой JSON.')
+            data[key] = value
+        return DataAndFiles(data, result.files)
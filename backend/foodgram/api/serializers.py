@@ -1,3 +1,7 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Manager, prefetch_related_objects
 from rest_framework import serializers
 from djoser.serializers import UserSerializer
 from drf_extra_fields.fields import Base64ImageField
@@ -5,7 +9,12 @@ from drf_extra_fields.fields import Base64ImageField
 from recipes.models import (Ingredient, Favorite, Recipe,
                             RecipeIngredient, Tag, ShoppingCart)
 from users.models import Follow, User
-from core.services import recipe_create_update
+from .fields import (Base64OrUploadedImageField, BulkManyRelatedField,
+                     ImageVariantsField, get_objects_in_bulk)
+from core.services import (change_shopping_cart_totals, get_recipe_amounts,
+                           get_recipe_cart_users, get_subscriptions,
+                           recipe_create_update, recipe_ingredients_update)
+from core.cache import get_versions, make_key
 from core.validators import validate_fields
 from core.constants import MIN_COUNT, MAX_COUNT
 
@@ -30,25 +39,24 @@ class UserSerializer(UserSerializer):
     """Сериализатор для модели пользователя."""
 
     avatar = Base64ImageField()
+    avatar_variants = ImageVariantsField('avatar')
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta(UserSerializer.Meta):
-        fields = UserSerializer.Meta.fields + ('is_subscribed', 'avatar')
+        fields = UserSerializer.Meta.fields + ('is_subscribed', 'avatar',
+                                               'avatar_variants')
 
     def get_is_subscribed(self, obj):
         """Получение значения для поля is_subscribed."""
-        request = self.context['request']
-        user = request.user
-        return (request and user.is_authenticated
-                and user.user_subscriptions.filter(
-                    author=obj
-                ).exists())
+        request = self.context.get('request')
+        return (request is not None and request.user.is_authenticated
+                and obj.id in get_subscriptions(request))
 
 
 class AvatarSerializer(serializers.ModelSerializer):
     """Сериализатор для поля avatar модели пользоваетля."""
 
-    avatar = Base64ImageField()
+    avatar = Base64OrUploadedImageField()
 
     class Meta:
         model = User
@@ -78,6 +86,25 @@ class ReadRecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class WriteRecipeIngredientListSerializer(serializers.ListSerializer):
+    """
+    Вспомогательный сериализатор.
+
+    Проверяет существование всех ингредиентов рецепта одним запросом
+    и заменяет их id объектами Ingredient.
+    """
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ingredients = get_objects_in_bulk(
+            Ingredient.objects.all(), [item['id'] for item in items],
+            'Ингредиенты с id {} не существуют.'
+        )
+        for item, ingredient in zip(items, ingredients):
+            item['id'] = ingredient
+        return items
+
+
 class WriteRecipeIngredientSerializer(serializers.ModelSerializer):
     """
     Вспомогательный сериализатор.
@@ -86,7 +113,7 @@ class WriteRecipeIngredientSerializer(serializers.ModelSerializer):
     Используется в RecipeSerializer.
     """
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(
         min_value=MIN_COUNT,
         max_value=MAX_COUNT,
@@ -101,16 +128,38 @@ class WriteRecipeIngredientSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'amount')
+        list_serializer_class = WriteRecipeIngredientListSerializer
+
+
+class RecipeGETListSerializer(serializers.ListSerializer):
+    """
+    Вспомогательный сериализатор.
+
+    Получает закэшированные данные всех рецептов страницы одним
+    обращением к кэшу. Используется в RecipeGETSerializer.
+    """
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, Manager) else data
+        return self.child.to_representations(list(recipes))
 
 
 class RecipeGETSerializer(serializers.ModelSerializer):
-    """Сериализатор для получения информации о рецептах."""
+    """
+    Сериализатор для получения информации о рецептах.
+
+    Не зависящая от пользователя часть рецепта (автор, теги, ингредиенты,
+    картинка, описание) кэшируется по id рецепта и версиям рецепта,
+    автора, тегов и ингредиентов. Для каждого запроса добавляются только
+    is_favorited, is_in_shopping_cart и author.is_subscribed.
+    """
 
     author = UserSerializer(read_only=True)
     ingredients = ReadRecipeIngredientSerializer(source='recipesingredients',
                                                  many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
     image = Base64ImageField(read_only=True)
+    image_variants = ImageVariantsField('image')
     is_favorited = serializers.BooleanField(default=False,
                                             read_only=True)
     is_in_shopping_cart = serializers.BooleanField(default=False,
@@ -120,7 +169,59 @@ class RecipeGETSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'image_variants', 'text', 'cooking_time')
+        list_serializer_class = RecipeGETListSerializer
+
+    def get_fragment_keys(self, recipes):
+        """Получение ключей кэша для данных рецептов."""
+        request = self.context.get('request')
+        base_url = request.build_absolute_uri('/') if request else ''
+        versions = get_versions(
+            'tags', 'ingredients',
+            *{f'recipe:{recipe.pk}' for recipe in recipes},
+            *{f'user:{recipe.author_id}' for recipe in recipes}
+        )
+        return {
+            recipe.pk: make_key(
+                'recipe', recipe.pk, base_url,
+                versions[f'recipe:{recipe.pk}'],
+                versions[f'user:{recipe.author_id}'],
+                versions['tags'], versions['ingredients']
+            ) for recipe in recipes
+        }
+
+    def to_representations(self, recipes):
+        """Предоставление данных о нескольких рецептах."""
+        keys = self.get_fragment_keys(recipes)
+        fragments = cache.get_many(keys.values())
+        missing = {}
+        result = []
+        for recipe in recipes:
+            fragment = fragments.get(keys[recipe.pk])
+            if fragment is None:
+                fragment = super().to_representation(recipe)
+                missing[keys[recipe.pk]] = fragment
+            result.append(self.add_user_data(fragment, recipe))
+        if missing:
+            cache.set_many(missing, settings.RECIPE_CACHE_TIMEOUT)
+        return result
+
+    def to_representation(self, instance):
+        return self.to_representations([instance])[0]
+
+    def add_user_data(self, fragment, recipe):
+        """Добавление к данным рецепта полей текущего пользователя."""
+        data = dict(fragment)
+        data['author'] = dict(
+            fragment['author'],
+            is_subscribed=self.fields['author'].get_is_subscribed(
+                recipe.author
+            )
+        )
+        data['is_favorited'] = getattr(recipe, 'is_favorited', False)
+        data['is_in_shopping_cart'] = getattr(recipe, 'is_in_shopping_cart',
+                                              False)
+        return data
 
 
 class RecipeSerializer(serializers.ModelSerializer):
@@ -129,9 +230,13 @@ class RecipeSerializer(serializers.ModelSerializer):
     author = serializers.HiddenField(default=serializers.CurrentUserDefault())
     ingredients = WriteRecipeIngredientSerializer(source='recipesingredients',
                                                   many=True)
-    tags = serializers.PrimaryKeyRelatedField(queryset=Tag.objects.all(),
-                                              many=True)
-    image = Base64ImageField()
+    tags = BulkManyRelatedField(
+        child_relation=serializers.PrimaryKeyRelatedField(
+            queryset=Tag.objects.all()
+        ),
+        error_messages={'does_not_exist': 'Теги с id {} не существуют.'}
+    )
+    image = Base64OrUploadedImageField()
     cooking_time = serializers.IntegerField(
         min_value=MIN_COUNT,
         max_value=MAX_COUNT,
@@ -148,6 +253,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = ('ingredients', 'tags', 'image',
                   'name', 'text', 'cooking_time', 'author')
 
+    @transaction.atomic
     def create(self, validated_data):
         """Создание рецепта."""
         ingredients_data = validated_data.pop('recipesingredients')
@@ -157,31 +263,47 @@ class RecipeSerializer(serializers.ModelSerializer):
         recipe_create_update(ingredients_data, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Изменение рецепта."""
+        """
+        Изменение рецепта.
+
+        Ингредиенты обновляются по разнице со старым составом
+        (recipe_ingredients_update); вместе с итогами списков покупок
+        и тегами все изменения выполняются в одной транзакции. Теги
+        меняются после сохранения рецепта: сигнал пересчитывает
+        tags_mask в базе данных, и save() не должен перезаписать его
+        старым значением.
+        """
         if 'recipesingredients' not in validated_data:
             raise serializers.ValidationError(
                 'Нельзя обновить рецепт без поля ingredients!'
             )
-        ingredients_data = validated_data.pop('recipesingredients')
-        instance.ingredients.clear()
-        recipe_create_update(ingredients_data, instance)
         if 'tags' not in validated_data:
             raise serializers.ValidationError(
                 'Нельзя обновить рецепт без поля tags!'
             )
-        tags_data = validated_data.pop('tags')
-        instance.tags.set(tags_data)
-
-        return super().update(instance, validated_data)
+        change_shopping_cart_totals(
+            get_recipe_cart_users(instance),
+            recipe_ingredients_update(
+                validated_data.pop('recipesingredients'), instance
+            )
+        )
+        tags = validated_data.pop('tags')
+        instance = super().update(instance, validated_data)
+        instance.tags.set(tags)
+        return instance
 
     def to_representation(self, instance):
         """
         Предоставление данных о рецепте.
 
         При создании/обновлении рецепта данные предоставляются
-        в полном виде.
+        в полном виде. Связанные объекты загружаются заранее, чтобы
+        число запросов не зависело от размера рецепта.
         """
+        prefetch_related_objects([instance],
+                                 *Recipe.objects.get_prefetches())
         return RecipeGETSerializer(instance, context=self.context).data
 
     def validate_ingredients(self, value):
@@ -210,9 +332,42 @@ class PartialRecipeSerializer(serializers.ModelSerializer):
     Используется в FollowSerializer и ShoppingFavoriteMixin.
     """
 
+    image_variants = ImageVariantsField('image')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+class RecipeMatchSerializer(PartialRecipeSerializer):
+    """
+    Сериализатор подбора рецептов по ингредиентам.
+
+    Имеющиеся ингредиенты передаются в контексте (ingredients);
+    ингредиенты рецепта должны быть загружены prefetch_related.
+    """
+
+    coverage = serializers.SerializerMethodField()
+    missing = serializers.SerializerMethodField()
+
+    class Meta(PartialRecipeSerializer.Meta):
+        fields = PartialRecipeSerializer.Meta.fields + ('coverage', 'missing')
+
+    def get_missing_ingredients(self, obj):
+        ingredients = self.context['ingredients']
+        return [item for item in obj.recipesingredients.all()
+                if item.ingredient_id not in ingredients]
+
+    def get_coverage(self, obj):
+        total = len(obj.recipesingredients.all())
+        if not total:
+            return 0
+        return round(1 - len(self.get_missing_ingredients(obj)) / total, 3)
+
+    def get_missing(self, obj):
+        return ReadRecipeIngredientSerializer(
+            self.get_missing_ingredients(obj), many=True
+        ).data
 
 
 class FollowWriteSerializer(serializers.ModelSerializer):
@@ -251,25 +406,21 @@ class FollowReadSerializer(UserSerializer):
     """Сериализатор для получения информации о подписках."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(default=0)
 
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields + ('recipes', 'recipes_count')
 
     def get_recipes(self, obj):
-        "Получение рецептов автора."
+        """
+        Получение рецептов автора.
+
+        Значение recipes_limit разбирается во view один раз за запрос
+        и передается в контексте.
+        """
         recipes = obj.recipes.all()
-        request = self.context['request']
-        if 'recipes_limit' in request.query_params:
-            try:
-                recipes_limit = int(
-                    request.query_params['recipes_limit']
-                )
-                recipes = recipes[:recipes_limit]
-            except ValueError:
-                raise serializers.ValidationError(
-                    'Пармаетр recipes_limit не является числом.'
-                )
+        recipes_limit = self.context.get('recipes_limit')
+        if recipes_limit is not None:
+            recipes = recipes[:recipes_limit]
         return PartialRecipeSerializer(
             recipes,
             many=True,
@@ -316,3 +467,13 @@ class ShoppingCartSerializer(ShoppingFavoriteSerializer):
     class Meta:
         model = ShoppingCart
         fields = '__all__'
+
+    @transaction.atomic
+    def create(self, validated_data):
+        """Добавление рецепта в список покупок с обновлением итогов."""
+        shopping_cart = super().create(validated_data)
+        change_shopping_cart_totals(
+            (shopping_cart.user_id,),
+            get_recipe_amounts(shopping_cart.recipe)
+        )
+        return shopping_cart
@@ -0,0 +1,594 @@
+import json
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from io import StringIO
+from itertools import combinations
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.db import close_old_connections, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.views import RecipeViewSet
+from core.matching import recipe_ingredient_index
+from core.search import ingredient_index
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingCartTotal, Tag)
+from users.models import Follow, User
+
+RECIPES_COUNT = 12
+INGREDIENTS_PER_RECIPE = 4
+PAGE_SIZES = (1, 5, 10)
+FILTERS = {
+    'tags': 'tags=breakfast&tags=dinner',
+    'tags_all': 'tags_all=breakfast&tags_all=lunch',
+    'author': 'author={author}',
+    'is_favorited': 'is_favorited=1',
+    'is_in_shopping_cart': 'is_in_shopping_cart=1',
+    'search': 'search=Рецепт',
+    'ordering': 'ordering=popular',
+}
+
+
+class RecipeQueriesTest(TestCase):
+    """Число запросов к базе данных при чтении рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Тестовый', password='pass'
+        )
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{index}', email=f'author{index}@example.com',
+                first_name='Автор', last_name='Тестовый', password='pass'
+            ) for index in range(3)
+        ]
+        tags = [Tag.objects.create(name=slug, slug=slug)
+                for slug in ('breakfast', 'lunch', 'dinner')]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {index}',
+                                      measurement_unit='г')
+            for index in range(10)
+        ]
+        for index in range(RECIPES_COUNT):
+            recipe = Recipe.objects.create(
+                author=cls.authors[index % len(cls.authors)],
+                name=f'Рецепт {index}', text='Описание',
+                image='recipes/images/test.png', cooking_time=10
+            )
+            recipe.tags.set(tags[:index % len(tags) + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe,
+                                 ingredient=ingredients[(index + shift) % 10],
+                                 amount=shift + 1)
+                for shift in range(INGREDIENTS_PER_RECIPE)
+            )
+            if index % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        cls.recipe = recipe
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url):
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.get(url)
+        return len(context)
+
+    def assert_constant_queries(self, query):
+        """Число запросов не зависит от размера страницы."""
+        url = f'/api/recipes/?{query}&limit='
+        expected = self.count_queries(url + str(PAGE_SIZES[0]))
+        for page_size in PAGE_SIZES[1:]:
+            with self.assertNumQueries(expected):
+                self.get(url + str(page_size))
+
+    def test_list(self):
+        self.assert_constant_queries('')
+        self.assert_constant_queries('cursor=')
+
+    def test_list_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assert_constant_queries('')
+
+    def test_filters(self):
+        queries = {name: query.format(author=self.authors[0].pk)
+                   for name, query in FILTERS.items()}
+        for size in (1, 2):
+            for names in combinations(queries, size):
+                with self.subTest(filters=names):
+                    self.assert_constant_queries(
+                        '&'.join(queries[name] for name in names)
+                    )
+
+    def test_cursor(self):
+        response = self.get('/api/recipes/?cursor=&limit=5')
+        found = [recipe['id'] for recipe in response.data['results']]
+        response = self.get(response.data['next'])
+        found += [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(found, list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('pk', flat=True)[:10]))
+
+    def test_invalid_cursor(self):
+        cursors = ['garbage', urlsafe_b64encode(b'{}').decode()] + [
+            urlsafe_b64encode(json.dumps(position).encode()).decode()
+            for position in (['2024-01-01T00:00:00+00:00'], [None, 1],
+                             ['garbage', 1], [{'a': 1}, 1],
+                             ['2024-01-01T00:00:00+00:00', 'x'])
+        ]
+        for url, invalid in (('/api/recipes/', cursors),
+                             ('/api/recipes/feed/', cursors),
+                             ('/api/users/subscriptions/', cursors[:4])):
+            for cursor in invalid:
+                with self.subTest(url=url, cursor=cursor):
+                    response = self.client.get(f'{url}?cursor={cursor}')
+                    self.assertEqual(response.status_code, 404)
+
+    def test_feed_filters(self):
+        for author in self.authors[:2]:
+            Follow.objects.create(user=self.user, author=author)
+        found = []
+        url = '/api/recipes/feed/?tags=lunch&limit=1'
+        with patch('recipes.models.FEED_FANOUT_THRESHOLD', 0), \
+                patch('recipes.models.connection', vendor='postgresql'):
+            while url:
+                response = self.get(url)
+                found += [recipe['id'] for recipe in response.data['results']]
+                url = response.data['next']
+        self.assertTrue(found)
+        self.assertEqual(found, list(Recipe.objects.filter(
+            author__in=self.authors[:2], tags__slug='lunch'
+        ).order_by('-pub_date', '-id').values_list('pk', flat=True)))
+
+    def test_ranked_cursor(self):
+        for url in ('/api/recipes/trending/?cursor=',
+                    '/api/recipes/?ordering=popular&cursor='):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cursor', response.data)
+
+    def test_stale_count(self):
+        cache.clear()
+        response = self.client.get('/api/recipes/?limit=5')
+        self.assertEqual(response.data['count'], RECIPES_COUNT)
+        Recipe.objects.bulk_create(
+            Recipe(author=self.user, name=f'Новый рецепт {index}',
+                   text='Описание', image='recipes/images/test.png',
+                   cooking_time=10)
+            for index in range(10)
+        )
+        response = self.client.get('/api/recipes/?limit=5&page=4')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['count_exact'])
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNotNone(response.data['next'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+        response = self.client.get('/api/recipes/?limit=5&page=6')
+        self.assertEqual(response.status_code, 404)
+
+    def test_stale_count_too_high(self):
+        cache.clear()
+        response = self.client.get('/api/recipes/?limit=5')
+        self.assertEqual(response.data['count'], RECIPES_COUNT)
+        Recipe.objects.filter(
+            pk__in=Recipe.objects.order_by('pk').values('pk')[:5]
+        ).delete()
+        response = self.client.get('/api/recipes/?limit=5&page=2')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['count'], RECIPES_COUNT - 5)
+        self.assertTrue(response.data['count_exact'])
+        self.assertIsNone(response.data['next'])
+        response = self.client.get('/api/recipes/?limit=5')
+        self.assertEqual(response.data['count'], RECIPES_COUNT - 5)
+        self.assertIsNotNone(response.data['next'])
+        response = self.client.get('/api/recipes/?limit=5&page=3')
+        self.assertEqual(response.status_code, 404)
+
+    def test_retrieve(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        expected = self.count_queries(url)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=self.recipe, ingredient=ingredient,
+                             amount=1)
+            for ingredient in Ingredient.objects.exclude(
+                recipe=self.recipe
+            )
+        )
+        with self.assertNumQueries(expected):
+            response = self.get(url)
+        self.assertEqual(len(response.data['ingredients']), 10)
+
+
+class RecipeUpdateTest(TestCase):
+    """Изменение рецепта через API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Тестовый', password='pass'
+        )
+        cls.tags = {slug: Tag.objects.create(name=slug, slug=slug)
+                    for slug in ('breakfast', 'lunch', 'dinner')}
+        cls.ingredient = Ingredient.objects.create(name='Ингредиент',
+                                                   measurement_unit='г')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            image='recipes/images/test.png', cooking_time=10
+        )
+        cls.recipe.tags.set((cls.tags['breakfast'],))
+        RecipeIngredient.objects.create(recipe=cls.recipe,
+                                        ingredient=cls.ingredient, amount=1)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def get_found(self, query):
+        response = self.client.get(f'/api/recipes/?{query}')
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_update_tags(self):
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/',
+            {'name': 'Новое название',
+             'tags': [self.tags['lunch'].pk, self.tags['dinner'].pk],
+             'ingredients': [{'id': self.ingredient.pk, 'amount': 2}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.get_found('tags=breakfast'), [])
+        self.assertEqual(self.get_found('tags=lunch'), [self.recipe.pk])
+        self.assertEqual(self.get_found('tags_all=lunch&tags_all=dinner'),
+                         [self.recipe.pk])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Новое название')
+
+
+class RecipeDeleteTest(TestCase):
+    """Удаление рецептов и ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Тестовый', password='pass'
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {index}',
+                                      measurement_unit='г')
+            for index in range(25)
+        ]
+
+    def create_recipe(self, ingredients):
+        recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            image='recipes/images/test.png', cooking_time=10
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        )
+        return recipe
+
+    def count_delete_queries(self, recipe):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        with CaptureQueriesContext(connection) as context:
+            response = client.delete(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.status_code, 204)
+        return len(context)
+
+    def test_delete_recipe(self):
+        small = self.create_recipe(self.ingredients[:1])
+        large = self.create_recipe(self.ingredients)
+        self.assertEqual(self.count_delete_queries(small),
+                         self.count_delete_queries(large))
+        self.assertFalse(RecipeIngredient.objects.exists())
+
+    def test_delete_recipe_with_favorites(self):
+        User.objects.bulk_create(
+            User(username=f'reader{index}', email=f'reader{index}@example.com')
+            for index in range(20)
+        )
+        readers = list(User.objects.exclude(pk=self.author.pk))
+        small = self.create_recipe(self.ingredients[:1])
+        large = self.create_recipe(self.ingredients[:1])
+        for recipe, users in ((small, readers[:1]), (large, readers)):
+            for model in (Favorite, ShoppingCart):
+                model.objects.bulk_create(
+                    model(user=user, recipe=recipe) for user in users
+                )
+        self.assertEqual(self.count_delete_queries(small),
+                         self.count_delete_queries(large))
+        self.assertFalse(Favorite.objects.exists())
+        self.assertFalse(ShoppingCart.objects.exists())
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+    def test_delete_ingredient(self):
+        recipes = [self.create_recipe(self.ingredients[:index + 1])
+                   for index in range(3)]
+        Recipe.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        with self.assertNumQueries(4):
+            self.ingredients[1].delete()
+        self.assertEqual(
+            list(Recipe.objects.filter(
+                updated_at__gte=timezone.now() - timedelta(hours=1)
+            ).order_by('pk').values_list('pk', flat=True)),
+            [recipe.pk for recipe in recipes[1:]]
+        )
+
+
+class ShoppingCartDownloadTest(TestCase):
+    """Скачивание списка покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer', email='buyer@example.com',
+            first_name='Покупатель', last_name='Тестовый', password='pass'
+        )
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {index}',
+                                      measurement_unit='г')
+            for index in range(60)
+        ]
+        recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Описание',
+            image='recipes/images/test.png', cooking_time=10
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=2)
+            for ingredient in ingredients
+        )
+        cls.recipe = recipe
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def download(self, file_format):
+        response = self.client.get('/api/recipes/download_shopping_cart/',
+                                   {'file_format': file_format})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_formats(self):
+        self.assertIn('Ингредиент 0 - 2 г\n',
+                      self.download('txt').decode())
+        self.assertEqual(len(self.download('csv').decode().splitlines()),
+                         61)
+        self.assertEqual(len(json.loads(self.download('json'))), 60)
+        content = self.download('pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertIn(b'DejaVuSans', content)
+        self.assertEqual(content.count(b'/Type /Page\n'), 2)
+        response = self.client.get('/api/recipes/download_shopping_cart/',
+                                   {'file_format': 'doc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeMatchTest(TestCase):
+    """Подбор рецептов по индексу ингредиентов в памяти процесса."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Тестовый', password='pass'
+        )
+        cls.ingredient = Ingredient.objects.create(name='Ингредиент',
+                                                   measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+        recipe_ingredient_index.state = None
+
+    def create_recipes(self, count):
+        Recipe.objects.bulk_create(
+            Recipe(author=self.author, name='Рецепт', text='Описание',
+                   image='recipes/images/test.png', cooking_time=10)
+            for _ in range(count)
+        )
+        recipes = list(Recipe.objects.order_by('-pk')[:count])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=self.ingredient,
+                             amount=1)
+            for recipe in recipes
+        )
+        return recipes
+
+    def get_found(self):
+        response = self.client.get('/api/recipes/match/',
+                                   {'ingredients': self.ingredient.pk})
+        return {recipe['id'] for recipe in response.data}
+
+    def test_max_age(self):
+        first = self.create_recipes(1)
+        self.assertEqual(self.get_found(), {first[0].pk})
+        second = self.create_recipes(2)
+        self.assertEqual(self.get_found(), {first[0].pk})
+        recipe_ingredient_index.expires = 0
+        self.assertEqual(self.get_found(),
+                         {recipe.pk for recipe in first + second})
+
+
+class ASGIDownloadTest(TransactionTestCase):
+    """Скачивание списка покупок через обработчик ASGI."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='buyer', email='buyer@example.com',
+            first_name='Покупатель', last_name='Тестовый', password='pass'
+        )
+        self.token = Token.objects.create(user=self.user)
+        ShoppingCartTotal.objects.bulk_create(
+            ShoppingCartTotal(
+                user=self.user, amount=3,
+                ingredient=Ingredient.objects.create(
+                    name=f'Ингредиент {index}', measurement_unit='г'
+                )
+            ) for index in range(3)
+        )
+        with override_settings(SERVER_MODE='asgi'):
+            view = RecipeViewSet.as_view({'get': 'download_shopping_cart'})
+        self.urlconf = type('urlconf', (),
+                            {'urlpatterns': [path('download/', view)]})
+
+    def request(self, query):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/download/',
+            'query_string': query.encode(), 'server': ('testserver', 80),
+            'headers': [(b'host', b'testserver'),
+                        (b'authorization', f'Token {self.token}'.encode())],
+        }
+        request_started.disconnect(close_old_connections)
+        try:
+            with override_settings(ROOT_URLCONF=self.urlconf):
+                async_to_sync(ASGIHandler())(scope, receive, send)
+        finally:
+            request_started.connect(close_old_connections)
+        self.assertEqual(messages[0]['status'], 200)
+        return b''.join(message.get('body', b'')
+                        for message in messages[1:])
+
+    def test_download(self):
+        self.assertEqual(
+            self.request('file_format=csv').decode().splitlines(),
+            ['name,amount,measurement_unit'] + [
+                f'Ингредиент {index},3,г' for index in range(3)
+            ]
+        )
+        self.assertTrue(self.request('file_format=pdf').startswith(b'%PDF'))
+
+
+class CountersTest(TestCase):
+    """Счетчики при сохранении и удалении моделей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = (
+            User.objects.create_user(
+                username=username, email=f'{username}@example.com',
+                first_name='Имя', last_name='Фамилия', password='pass'
+            ) for username in ('author', 'reader')
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            image='recipes/images/test.png', cooking_time=10
+        )
+
+    def test_save_keeps_counters(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        author = User.objects.get(pk=self.author.pk)
+        Favorite.objects.create(user=self.reader, recipe=recipe)
+        ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+        Follow.objects.create(user=self.reader, author=author)
+        recipe.name = 'Новое название'
+        recipe.save()
+        author.first_name = 'Новое имя'
+        author.save()
+        recipe.refresh_from_db()
+        author.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual((recipe.favorites_count, recipe.in_carts_count),
+                         (1, 1))
+        self.assertEqual(author.first_name, 'Новое имя')
+        self.assertEqual((author.recipes_count, author.followers_count),
+                         (1, 1))
+
+    def test_delete_user(self):
+        for user in (self.author, self.reader):
+            Favorite.objects.create(user=user, recipe=self.recipe)
+            ShoppingCart.objects.create(user=user, recipe=self.recipe)
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.author, author=self.reader)
+        self.reader.delete()
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(
+            (self.recipe.favorites_count, self.recipe.in_carts_count), (1, 1)
+        )
+        self.assertEqual(
+            (self.author.recipes_count, self.author.followers_count), (1, 0)
+        )
+        self.recipe.delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+
+class IngredientSearchTest(TestCase):
+    """Поиск ингредиентов по индексу в памяти процесса."""
+
+    def setUp(self):
+        cache.clear()
+        for name in ('Морковь', 'молоко', 'Сахар'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def get_names(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_search(self):
+        self.assertEqual(self.get_names('мо'), ['молоко', 'Морковь'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Мод', measurement_unit='г')
+        self.assertEqual(self.get_names('мо'), ['Мод', 'молоко', 'Морковь'])
+        self.assertEqual(self.get_names('сахар'), ['Сахар'])
+
+    def test_load_data(self):
+        self.assertEqual(self.get_names('абрикос'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('load_data', stdout=StringIO())
+        self.assertIn('абрикосовое варенье', self.get_names('абрикос'))
+
+    def test_max_age(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Тестовый', password='pass'
+        ))
+        self.assertEqual(self.get_names('сол'), [])
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='Соль', measurement_unit='г')]
+        )
+        self.assertEqual(self.get_names('сол'), [])
+        ingredient_index.expires = 0
+        self.assertEqual(self.get_names('сол'), ['Соль'])
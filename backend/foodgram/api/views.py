@@ -1,6 +1,7 @@
-import short_url
-from django.db.models import Sum, Count, F
-from django.http import FileResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Prefetch, Q
+from django.http import Http404, StreamingHttpResponse
 from django.urls import reverse
 from django.shortcuts import get_object_or_404
 from rest_framework import status
@@ -8,29 +9,44 @@ from rest_framework import viewsets
 from rest_framework import permissions
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, JSONParser
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 
 from .serializers import (AvatarSerializer, IngredientSerializer,
                           FavoriteSerializer, FollowWriteSerializer,
-                          FollowReadSerializer,
+                          FollowReadSerializer, PartialRecipeSerializer,
+                          RecipeMatchSerializer,
                           RecipeSerializer, RecipeGETSerializer,
                           ShoppingCartSerializer, TagSerializer)
+from .mixins import AnonymousCacheMixin, ASGIViewMixin
+from .parsers import MultiPartJSONParser
 from .permissions import IsAuthorOrReadOnly
-from .pagination import UserRecipePagination
-from .filters import IngredientSearchFilter, RecipeFilter
-from recipes.models import (Ingredient, Favorite,
-                            Recipe, RecipeIngredient,
-                            ShoppingCart, Tag, URL)
+from .pagination import FeedPagination, UserRecipePagination
+from .filters import RecipeFilter
+from recipes.models import (Ingredient, Favorite, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingCartTotal, Tag, URL)
 from users.models import Follow, User
-from core.services import delete_favorite_shopping, get_data
+from core.services import (change_shopping_cart_totals,
+                           delete_favorite_shopping, get_data,
+                           get_recipe_amounts, get_recipe_cart_users)
+from core.validators import validate_match_params, validate_recipes_limit
+from core.constants import INGREDIENT_SEARCH_LIMIT, SHOPPING_CART_FORMATS
+from core.matching import recipe_ingredient_index
+from core.search import ingredient_index
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ASGIViewMixin, AnonymousCacheMixin,
+                    viewsets.ModelViewSet):
     """ ViewSet для модели Recipe."""
 
+    cache_namespace = 'recipes'
+    cache_query_params = ('page', 'limit', 'cursor', 'tags', 'tags_all',
+                          'author', 'search', 'ordering')
     serializer_class = RecipeSerializer
     permission_classes = (IsAuthorOrReadOnly,)
+    parser_classes = (JSONParser, FormParser, MultiPartJSONParser)
+    multipart_json_fields = ('ingredients', 'tags')
     pagination_class = UserRecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
@@ -40,14 +56,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
         queryset = Recipe.objects.with_relation()
         if user.is_authenticated:
             queryset = Recipe.objects.with_annotation(user)
+        if self.action == 'trending':
+            queryset = queryset.filter(ranking__trending__gt=0).order_by(
+                '-ranking__trending', '-pub_date'
+            )
         return queryset
 
     def get_serializer_class(self):
         """Функция для выбора сериализатора."""
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'trending', 'feed'):
             return RecipeGETSerializer
         return RecipeSerializer
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        """Удаление рецепта с вычетом его из итогов списков покупок."""
+        change_shopping_cart_totals(get_recipe_cart_users(instance),
+                                    get_recipe_amounts(instance, -1))
+        instance.delete()
+
     @staticmethod
     def add_favorite_or_cart(serializer, pk, request):
         recipe = get_object_or_404(Recipe, pk=pk)
@@ -107,21 +134,123 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @action(methods=('get',), detail=False,
             permission_classes=(permissions.IsAuthenticated,))
     def download_shopping_cart(self, request):
-        """Скачивание списка покупок текущим пользователем."""
-        user = request.user
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shoppingcarts__user=user
+        """
+        Скачивание списка покупок текущим пользователем.
+
+        Формат файла задается параметром file_format: txt (по умолчанию),
+        csv, json или pdf. Итоги берутся из таблицы ShoppingCartTotal, читаются
+        курсором и отдаются клиенту по мере генерации. В режиме ASGI файл
+        сначала генерируется в потоке пула (core.concurrency).
+        """
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in SHOPPING_CART_FORMATS:
+            return Response(
+                'Допустимые форматы: '
+                f'{", ".join(SHOPPING_CART_FORMATS)}.',
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ingredients = ShoppingCartTotal.objects.filter(
+            user=request.user
         ).values(
+            'amount',
             name=F('ingredient__name'),
             measurement_unit=F('ingredient__measurement_unit')
-        ).annotate(amount=Sum('amount')).order_by('ingredient__name')
-        my_data = get_data(ingredients)
-        response = FileResponse(my_data, content_type='text/plain')
+        ).order_by('ingredient__name')
+        response = StreamingHttpResponse(
+            get_data(ingredients.iterator(), file_format),
+            content_type=SHOPPING_CART_FORMATS[file_format]
+        )
         response['Content-Disposition'] = (
-            'attachment; filename="shoppingcart.txt"'
+            f'attachment; filename="shoppingcart.{file_format}"'
         )
         return response
 
+    @action(methods=('get',), detail=False)
+    def trending(self, request):
+        """
+        Рецепты, набирающие популярность.
+
+        Рецепты с ненулевым рейтингом trending из таблицы RecipeRanking
+        (команда compute_rankings); фильтры и пагинация как у списка.
+        """
+        return self.list(request)
+
+    def get_cursor_filter(self, position, limit):
+        """
+        Условие ленты подписок для позиции курсора пагинации.
+
+        Стратегия 'merge' ограничивает выборку limit рецептами на автора
+        до фильтров RecipeFilter, поэтому с фильтрами используется 'in'.
+        """
+        if self.action != 'feed':
+            return Q()
+        filtered = any(name in self.request.query_params
+                       for name in self.filterset_class.base_filters)
+        return Recipe.objects.get_feed_filter(
+            self.request.user, position, limit,
+            strategy='in' if filtered else None
+        )
+
+    @action(methods=('get',), detail=False,
+            permission_classes=(permissions.IsAuthenticated,),
+            pagination_class=FeedPagination)
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан текущий пользователь.
+
+        Рецепты всех авторов идут одним списком по дате публикации;
+        пагинация курсорная (параметр cursor из ссылки next).
+        """
+        return self.list(request)
+
+    @action(methods=('get',), detail=False)
+    def match(self, request):
+        """
+        Подбор рецептов по имеющимся ингредиентам.
+
+        Рецепты ранжируются по доле своих ингредиентов, входящих в набор
+        ingredients; для каждого рецепта перечислены недостающие
+        ингредиенты. Кандидаты отбираются по индексу в памяти процесса
+        (core.matching) с запасом на рецепты, удаленные после его
+        обновления.
+        """
+        ingredients, limit, min_coverage = validate_match_params(request)
+        ranked = recipe_ingredient_index.match(ingredients, limit * 2,
+                                               min_coverage)
+        recipes = Recipe.objects.prefetch_related(Prefetch(
+            'recipesingredients',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+        )).in_bulk([recipe_id for recipe_id, _ in ranked])
+        serializer = RecipeMatchSerializer(
+            [recipes[recipe_id] for recipe_id, _ in ranked
+             if recipe_id in recipes][:limit],
+            many=True,
+            context={'request': request, 'ingredients': ingredients}
+        )
+        return Response(serializer.data)
+
+    @action(methods=('get',), detail=True)
+    def similar(self, request, pk=None):
+        """
+        Похожие рецепты.
+
+        Рецепты с близким составом ингредиентов и тегов из таблицы
+        RecipeNeighbor (команда compute_similar_recipes).
+        """
+        return self.get_cached_response(self.get_similar, request)
+
+    def get_similar(self, request):
+        recipes = Recipe.objects.filter(
+            neighbor_of__recipe_id=self.kwargs['pk']
+        ).order_by('-neighbor_of__score', 'pk')
+        if not recipes and not Recipe.objects.filter(
+            pk=self.kwargs['pk']
+        ).exists():
+            raise Http404
+        return Response(PartialRecipeSerializer(
+            recipes, many=True, context={'request': request}
+        ).data)
+
     @action(methods=('get',), detail=True, url_path='get-link')
     def getlink(self, request, pk=None):
         """
@@ -131,41 +260,58 @@ class RecipeViewSet(viewsets.ModelViewSet):
         ссылку на выбранный рецепт.
         """
         recipe = get_object_or_404(Recipe, pk=self.kwargs['pk'])
-        url = request.headers.get('Referer')
-        if not url:
-            url = request.build_absolute_uri(reverse('recipes-detail',
-                                                     args=(recipe.pk,)))
-        if URL.objects.filter(url=url).exists():
-            hash = URL.objects.get(url=url).hash
-        else:
-            hash = short_url.encode_url(recipe.pk)
-            URL.objects.create(hash=hash, url=url)
-        short = request.build_absolute_uri(reverse('get_url', args=(hash,)))
+        link, _ = URL.objects.get_or_create(
+            recipe=recipe, defaults={'hash': URL.get_hash(recipe.pk)}
+        )
+        short = request.build_absolute_uri(reverse('get_url',
+                                                   args=(link.hash,)))
         return Response({'short-link': short})
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ASGIViewMixin, AnonymousCacheMixin,
+                 viewsets.ReadOnlyModelViewSet):
     """ ViewSet для модели Tag."""
 
+    cache_namespace = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (permissions.AllowAny,)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ASGIViewMixin, AnonymousCacheMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """ ViewSet для модели Ingredient."""
 
+    cache_namespace = 'ingredients'
+    cache_query_params = ('name',)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (permissions.AllowAny,)
-    filter_backends = (IngredientSearchFilter,)
-    search_fields = ('^name',)
+
+    def list(self, request, *args, **kwargs):
+        """
+        Список ингредиентов.
+
+        Поиск по параметру name выполняется по индексу в памяти процесса,
+        без запроса к базе данных; число результатов ограничено.
+        """
+        if 'name' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        return self.get_cached_response(self.search, request)
+
+    def search(self, request):
+        return Response(ingredient_index.search(
+            request.query_params['name'],
+            limit=INGREDIENT_SEARCH_LIMIT,
+            substring=settings.INGREDIENT_SEARCH_SUBSTRING
+        ))
 
 
 class UserViewSet(UserViewSet):
     """ ViewSet для модели User."""
 
     pagination_class = UserRecipePagination
+    cursor_ordering = ('username', 'id')
 
     @action(methods=('get',), detail=False, url_path='me',
             permission_classes=(permissions.IsAuthenticated,))
@@ -208,12 +354,11 @@ class UserViewSet(UserViewSet):
         на выбранного пользователя.
         """
         user = request.user
-        author = get_object_or_404(User.objects.annotate(
-            recipes_count=Count('recipes')
-        ).order_by('username'), id=self.kwargs['id'])
+        author = get_object_or_404(User, id=self.kwargs['id'])
         serializer = FollowWriteSerializer(
             data={'user': user.id, 'author': author.id},
-            context={'request': request}
+            context={'request': request,
+                     'recipes_limit': validate_recipes_limit(request)}
         )
         serializer.is_valid(raise_exception=True)
         serializer.save()
@@ -245,11 +390,17 @@ class UserViewSet(UserViewSet):
         список своих подписок.
         """
         user = request.user
+        recipes_limit = validate_recipes_limit(request)
         authors = User.objects.filter(
             subscriptions_to_author__user=user
-        ).annotate(recipes_count=Count('recipes')).order_by('username')
+        ).prefetch_related(
+            Prefetch('recipes',
+                     queryset=Recipe.objects.latest_by_author(recipes_limit))
+        ).order_by('username')
         page = self.paginate_queryset(authors)
-        serializer = FollowReadSerializer(page,
-                                          context={'request': request},
-                                          many=True)
+        serializer = FollowReadSerializer(
+            page,
+            context={'request': request, 'recipes_limit': recipes_limit},
+            many=True
+        )
         return self.get_paginated_response(serializer.data)
@@ -0,0 +1,130 @@
+import random
+import time
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .services import reconcile_counters
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import Follow, User
+
+BENCH_PREFIX = 'bench_'
+BATCH_SIZE = 1000
+
+
+def clear_benchmark_data():
+    """Удаление данных, созданных для бенчмарков."""
+    deleted, _ = User.objects.filter(
+        username__startswith=BENCH_PREFIX
+    ).delete()
+    return deleted
+
+
+@transaction.atomic
+def seed_benchmark_data(users, recipes, ingredients_per_recipe=8,
+                        favorites_per_user=20, follows_per_user=10,
+                        seed=0):
+    """
+    Заполнение базы данных для бенчмарков.
+
+    Создаются пользователи с префиксом bench_, их рецепты с тегами и
+    ингредиентами, избранное, списки покупок и подписки. Даты публикации
+    рецептов распределяются по последнему году.
+    """
+    rnd = random.Random(seed)
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+    if not tag_ids or not ingredient_ids:
+        raise ValueError('Сначала загрузите теги и ингредиенты '
+                         '(load_tags, load_data).')
+    User.objects.bulk_create(
+        (User(username=f'{BENCH_PREFIX}{number}',
+              email=f'{BENCH_PREFIX}{number}@example.com',
+              first_name='Bench', last_name=str(number))
+         for number in range(users)),
+        batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+    user_ids = list(User.objects.filter(
+        username__startswith=BENCH_PREFIX
+    ).values_list('id', flat=True))
+    Recipe.objects.bulk_create(
+        (Recipe(author_id=rnd.choice(user_ids), name=f'Рецепт {number}',
+                text='Описание рецепта для бенчмарка',
+                image='recipes/images/bench.png', cooking_time=30)
+         for number in range(recipes)),
+        batch_size=BATCH_SIZE
+    )
+    recipe_ids = list(Recipe.objects.filter(
+        author__username__startswith=BENCH_PREFIX
+    ).values_list('id', flat=True))
+    now = timezone.now()
+    Recipe.objects.bulk_update(
+        (Recipe(pk=pk, pub_date=now - timedelta(
+            minutes=rnd.randrange(60 * 24 * 365)
+        )) for pk in recipe_ids),
+        ('pub_date',), batch_size=BATCH_SIZE
+    )
+    Recipe.tags.through.objects.bulk_create(
+        (Recipe.tags.through(recipe_id=pk, tag_id=tag_id)
+         for pk in recipe_ids
+         for tag_id in rnd.sample(tag_ids, rnd.randint(1, 3))),
+        batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        Recipe.objects.update_tags_mask(
+            *recipe_ids[start:start + BATCH_SIZE]
+        )
+    Recipe.objects.update_search_vector(*recipe_ids)
+    RecipeIngredient.objects.bulk_create(
+        (RecipeIngredient(recipe_id=pk, ingredient_id=ingredient_id,
+                          amount=rnd.randint(1, 500))
+         for pk in recipe_ids
+         for ingredient_id in rnd.sample(
+             ingredient_ids, min(ingredients_per_recipe, len(ingredient_ids))
+        )),
+        batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+    for model, per_user in ((Favorite, favorites_per_user),
+                            (ShoppingCart, favorites_per_user // 2)):
+        model.objects.bulk_create(
+            (model(user_id=user_id, recipe_id=recipe_id)
+             for user_id in user_ids
+             for recipe_id in rnd.sample(recipe_ids,
+                                         min(per_user, len(recipe_ids)))),
+            batch_size=BATCH_SIZE, ignore_conflicts=True
+        )
+    Follow.objects.bulk_create(
+        (Follow(user_id=user_id, author_id=author_id)
+         for user_id in user_ids
+         for author_id in rnd.sample(user_ids,
+                                     min(follows_per_user, len(user_ids)))
+         if author_id != user_id),
+        batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+    reconcile_counters()
+    return len(user_ids), len(recipe_ids)
+
+
+def explain(queryset):
+    """
+    План выполнения запроса.
+
+    В PostgreSQL запрос выполняется (EXPLAIN ANALYZE), в остальных
+    базах данных выводится только план.
+    """
+    if connection.vendor == 'postgresql':
+        return queryset.explain(analyze=True, buffers=True)
+    return queryset.explain()
+
+
+def timed(function, repeat=5):
+    """Лучшее время выполнения function из repeat попыток, в мс."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
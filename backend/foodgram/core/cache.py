@@ -0,0 +1,58 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'version:{}'
+
+
+def get_versions(*names):
+    """
+    Получение текущих версий пространств имен кэша.
+
+    Версия входит в ключи закэшированных данных, поэтому ее смена
+    делает все старые записи пространства недоступными. Отсутствующая
+    версия заводится по текущему времени, чтобы после вытеснения ключа
+    из кэша не вернуться к уже использованному значению.
+    """
+    keys = {name: VERSION_KEY.format(name) for name in names}
+    versions = cache.get_many(keys.values())
+    result = {}
+    for name, key in keys.items():
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key, 0)
+        result[name] = versions[key]
+    return result
+
+
+def get_version(name):
+    """Получение текущей версии одного пространства имен кэша."""
+    return get_versions(name)[name]
+
+
+def bump_versions(*names):
+    """Смена версий пространств имен кэша."""
+    for name in names:
+        key = VERSION_KEY.format(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def invalidate(*names):
+    """
+    Инвалидация пространств имен кэша после фиксации транзакции.
+
+    Пока транзакция не зафиксирована, параллельный запрос может снова
+    закэшировать старые данные, поэтому версии меняются в on_commit.
+    """
+    transaction.on_commit(lambda: bump_versions(*names))
+
+
+def make_key(prefix, *parts):
+    """Получение ключа кэша фиксированной длины из произвольных частей."""
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'{prefix}:{digest}'
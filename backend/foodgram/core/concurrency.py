@@ -0,0 +1,112 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from tempfile import SpooledTemporaryFile
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .constants import STREAM_CHUNK_SIZE, STREAM_SPOOL_SIZE
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+executor = ThreadPoolExecutor(thread_name_prefix='foodgram-query')
+
+
+def call_in_thread(function, *args, **kwargs):
+    """
+    Вызов function в стороннем потоке.
+
+    У потока свое соединение с базой данных; устаревшие соединения
+    закрываются до и после вызова, как при обработке запроса Django.
+    """
+    close_old_connections()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def spool_streaming_content(response):
+    """
+    Генерация потокового ответа в текущем потоке.
+
+    Django 3.2 под ASGI читает streaming_content в потоке цикла событий,
+    где запросы к базе данных запрещены. Поэтому содержимое заранее
+    записывается во временный файл (в памяти до STREAM_SPOOL_SIZE байт,
+    дальше на диске) и отдается из него частями.
+    """
+    spool = SpooledTemporaryFile(max_size=STREAM_SPOOL_SIZE)
+    for chunk in response.streaming_content:
+        spool.write(chunk)
+    spool.seek(0)
+    response.streaming_content = read_spool(spool)
+
+
+def read_spool(spool):
+    """Чтение временного файла частями с закрытием в конце."""
+    with spool:
+        yield from iter(partial(spool.read, STREAM_CHUNK_SIZE), b'')
+
+
+def render_view(view, request, *args, **kwargs):
+    """Вызов представления и подготовка ответа в одном потоке."""
+    response = view(request, *args, **kwargs)
+    if callable(getattr(response, 'render', None)):
+        response.render()
+    elif response.streaming:
+        spool_streaming_content(response)
+    return response
+
+
+def can_run_concurrently():
+    """
+    Можно ли выполнять запросы к базе данных в других потоках.
+
+    Внутри транзакции другие соединения не видят ее изменений, а SQLite
+    не рассчитан на параллельные соединения, поэтому в этих случаях
+    запросы выполняются последовательно.
+    """
+    return (settings.PARALLEL_QUERIES
+            and connection.vendor == 'postgresql'
+            and not connection.in_atomic_block)
+
+
+def run_concurrently(*functions):
+    """
+    Выполнение независимых функций с запросами к базе данных.
+
+    Первая функция выполняется в текущем потоке, остальные - в пуле
+    потоков. Возвращает список результатов в порядке функций.
+    """
+    if not can_run_concurrently():
+        return [function() for function in functions]
+    futures = [executor.submit(call_in_thread, function)
+               for function in functions[1:]]
+    return [functions[0]()] + [future.result() for future in futures]
+
+
+def asgi_view(view):
+    """
+    Адаптер синхронного представления для режима ASGI.
+
+    Django 3.2 выполняет синхронные представления под ASGI в одном общем
+    потоке, из-за чего запросы одного воркера обрабатываются по очереди.
+    Адаптер запускает чтение (GET, HEAD, OPTIONS) в пуле потоков, так что
+    ожидание базы данных и кэша разными запросами идет параллельно.
+    Изменяющие запросы остаются в общем потоке. В режиме WSGI
+    представление возвращается без изменений.
+    """
+    if settings.SERVER_MODE != 'asgi':
+        return view
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return await sync_to_async(view)(request, *args, **kwargs)
+        return await sync_to_async(
+            partial(call_in_thread, render_view, view),
+            thread_sensitive=False
+        )(request, *args, **kwargs)
+
+    return wrapper
@@ -5,7 +5,47 @@ LENGTH_MEASUREMENT_UNIT = 64
 USER_FIELDS_LENGTH = 150
 EMAIL_LENGTH = 254
 PAGE_SIZE = 6
+FEED_FANOUT_THRESHOLD = 100
+COUNT_ESTIMATE_THRESHOLD = 10000
 MIN_COUNT = 1
 MAX_COUNT = 32767
 LENGTH = 20
 COUNT_TAG_INGREDIENT = 5
+INGREDIENT_SEARCH_LIMIT = 50
+INGREDIENT_INDEX_MAX_AGE = 300
+SEARCH_CONFIG = 'russian'
+TAG_MASK_BITS = 63
+RECIPE_PAGE_URL = '/recipes/{}'
+IMAGE_VARIANTS = {
+    'thumbnail': (160, 120),
+    'card': (480, 360),
+    'full': (1280, 1280),
+}
+IMAGE_VARIANTS_DIR = 'variants'
+SHOPPING_CART_FORMATS = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+    'pdf': 'application/pdf',
+}
+PDF_FONT = ('DejaVuSans', 'data/fonts/DejaVuSans.ttf')
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_CHUNK_SIZE = 64 * 1024
+STREAM_SPOOL_SIZE = 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+RANKING_WEIGHTS = {
+    'favorite': 1.0,
+    'shoppingcart': 1.5,
+}
+RANKING_POPULAR_HALF_LIFE_DAYS = 30
+RANKING_TRENDING_HALF_LIFE_HOURS = 24
+RANKING_TRENDING_WINDOW_DAYS = 7
+MATCH_LIMIT = 20
+MATCH_MAX_INGREDIENTS = 100
+MATCH_REFRESH_MARGIN = 60
+MATCH_REBUILD_THRESHOLD = 1000
+MATCH_INDEX_MAX_AGE = 300
+SIMILAR_RECIPES_COUNT = 10
+SIMILAR_BATCH_SIZE = 200
+SIMILAR_REFRESH_MARGIN = 60
@@ -0,0 +1,122 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .cache import invalidate
+from .concurrency import call_in_thread
+from .constants import IMAGE_VARIANTS, IMAGE_VARIANTS_DIR
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS,
+                              thread_name_prefix='foodgram-images')
+
+
+def get_variants(instance, field_name):
+    """
+    Имена файлов вариантов изображения field_name.
+
+    Варианты хранятся в поле <field_name>_variants вместе с именем
+    исходного файла; если изображение с тех пор сменилось, возвращается
+    пустой словарь.
+    """
+    image = getattr(instance, field_name)
+    variants = getattr(instance, f'{field_name}_variants') or {}
+    if not image or variants.get('source') != image.name:
+        return {}
+    return variants
+
+
+def get_variant_name(name, variant, file_format):
+    directory, filename = os.path.split(name)
+    root, _ = os.path.splitext(filename)
+    return os.path.join(directory, IMAGE_VARIANTS_DIR,
+                        f'{root}_{variant}.{file_format.lower()}')
+
+
+def make_variants(image):
+    """
+    Создание вариантов изображения с ограниченными размерами.
+
+    Варианты строятся от большего к меньшему, каждый из предыдущего;
+    JPEG сразу декодируется в уменьшенном размере (Image.draft).
+    """
+    file_format = settings.IMAGE_VARIANT_FORMAT
+    storage = image.storage
+    with storage.open(image.name) as file, Image.open(file) as original:
+        original.draft('RGB', max(IMAGE_VARIANTS.values()))
+        picture = ImageOps.exif_transpose(original)
+        mode = ('RGBA' if file_format == 'WEBP'
+                and picture.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        picture = picture.convert(mode)
+        variants = {'source': image.name}
+        for variant, size in sorted(IMAGE_VARIANTS.items(),
+                                    key=lambda item: item[1], reverse=True):
+            picture.thumbnail(size, Image.LANCZOS)
+            buffer = BytesIO()
+            picture.save(buffer, file_format,
+                         quality=settings.IMAGE_VARIANT_QUALITY)
+            name = get_variant_name(image.name, variant, file_format)
+            storage.delete(name)
+            variants[variant] = storage.save(name,
+                                             ContentFile(buffer.getvalue()))
+    return variants
+
+
+def generate_variants(model, pk, field_name):
+    """
+    Создание вариантов изображения объекта и сохранение их имен.
+
+    Файлы прежних вариантов удаляются. Поле обновляется через update(),
+    только если изображение за время обработки не сменилось, поэтому
+    кэш рецептов сбрасывается явно.
+    """
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not getattr(instance, field_name):
+        return None
+    image = getattr(instance, field_name)
+    try:
+        variants = make_variants(image)
+    except (OSError, ValueError):
+        logger.exception('Не удалось обработать изображение %s', image.name)
+        return None
+    old_variants = getattr(instance, f'{field_name}_variants') or {}
+    for variant in IMAGE_VARIANTS:
+        name = old_variants.get(variant)
+        if name and name != variants[variant]:
+            image.storage.delete(name)
+    model.objects.filter(pk=pk, **{field_name: image.name}).update(
+        **{f'{field_name}_variants': variants}
+    )
+    invalidate('recipes', f'{model._meta.model_name}:{pk}')
+    return variants
+
+
+def schedule_variants(instance, field_name):
+    """
+    Постановка создания вариантов изображения в очередь.
+
+    Обработка запускается после фиксации транзакции в пуле потоков
+    executor, чтобы не занимать поток запроса. При
+    IMAGE_VARIANTS_ASYNC=False варианты создаются сразу.
+    """
+    image = getattr(instance, field_name)
+    if not image or get_variants(instance, field_name):
+        return
+    model, pk = type(instance), instance.pk
+    if not settings.IMAGE_VARIANTS_ASYNC:
+        def generate():
+            variants = generate_variants(model, pk, field_name)
+            if variants is not None:
+                setattr(instance, f'{field_name}_variants', variants)
+        transaction.on_commit(generate)
+        return
+    transaction.on_commit(lambda: executor.submit(
+        call_in_thread, generate_variants, model, pk, field_name
+    ))
@@ -0,0 +1,148 @@
+import threading
+import time
+from datetime import timedelta
+from itertools import chain
+
+import numpy as np
+from django.utils import timezone
+
+from .cache import get_version
+from .constants import (MATCH_INDEX_MAX_AGE, MATCH_REBUILD_THRESHOLD,
+                        MATCH_REFRESH_MARGIN)
+from recipes.models import Recipe, RecipeIngredient
+
+
+class RecipeIngredientIndex:
+    """
+    Обратный индекс ингредиент -> рецепты в памяти процесса.
+
+    Основная часть хранится в массивах NumPy: отсортированные id
+    ингредиентов, смещения их списков в postings и номера рецептов
+    в postings, а также id рецептов и число ингредиентов каждого рецепта.
+    Рецепты, измененные после построения, хранятся отдельно в changed
+    (id рецепта -> множество ингредиентов), а их строки в массивах
+    помечаются в stale. Изменения подгружаются по Recipe.updated_at при
+    смене версии кэша 'recipe_ingredients' (recipes.signals) и не реже
+    чем раз в MATCH_INDEX_MAX_AGE секунд, если версия из другого
+    процесса до воркера не доходит (кэш в локальной памяти); когда
+    измененных рецептов становится больше MATCH_REBUILD_THRESHOLD,
+    индекс строится заново.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.expires = 0
+        self.state = None
+
+    def build(self):
+        """Построение массивов индекса по таблице RecipeIngredient."""
+        loaded_at = timezone.now()
+        rows = RecipeIngredient.objects.order_by().values_list(
+            'recipe_id', 'ingredient_id'
+        )
+        pairs = np.fromiter(chain.from_iterable(rows.iterator()),
+                            dtype=np.int64).reshape(-1, 2)
+        recipe_ids, positions = np.unique(pairs[:, 0], return_inverse=True)
+        order = np.argsort(pairs[:, 1], kind='stable')
+        ingredient_ids, starts = np.unique(pairs[order, 1],
+                                           return_index=True)
+        return {
+            'loaded_at': loaded_at,
+            'recipe_ids': recipe_ids,
+            'sizes': np.bincount(positions,
+                                 minlength=len(recipe_ids)).astype(np.int32),
+            'ingredient_ids': ingredient_ids,
+            'offsets': np.append(starts, len(order)),
+            'postings': positions[order].astype(np.int32),
+            'stale': np.zeros(len(recipe_ids), dtype=bool),
+            'changed': {},
+        }
+
+    def update(self, state):
+        """
+        Загрузка рецептов, измененных с прошлого обновления.
+
+        Запас MATCH_REFRESH_MARGIN покрывает транзакции, которые
+        зафиксированы позже, чем записано их updated_at.
+        """
+        loaded_at = timezone.now()
+        since = state['loaded_at'] - timedelta(seconds=MATCH_REFRESH_MARGIN)
+        changed = dict(state['changed'])
+        recipe_ids = list(Recipe.objects.filter(
+            updated_at__gte=since
+        ).values_list('pk', flat=True))
+        for recipe_id in recipe_ids:
+            changed[recipe_id] = set()
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id'):
+            changed[recipe_id].add(ingredient_id)
+        if len(changed) > MATCH_REBUILD_THRESHOLD:
+            return self.build()
+        stale = state['stale'].copy()
+        known = np.array(list(changed), dtype=np.int64)
+        stale[np.isin(state['recipe_ids'], known)] = True
+        return dict(state, loaded_at=loaded_at, stale=stale, changed=changed)
+
+    def refresh(self):
+        """Обновление индекса, если рецепты изменились или он устарел."""
+        version = get_version('recipe_ingredients')
+        if version == self.version and time.monotonic() < self.expires:
+            return
+        with self.lock:
+            if version != self.version or time.monotonic() >= self.expires:
+                self.state = (self.build() if self.state is None
+                              else self.update(self.state))
+                self.version = version
+                self.expires = time.monotonic() + MATCH_INDEX_MAX_AGE
+
+    def match(self, ingredients, limit, min_coverage=0):
+        """
+        Рецепты, лучше всего покрываемые набором ингредиентов.
+
+        Покрытие - доля ингредиентов рецепта, входящих в набор.
+        Совпадения считаются векторно: списки рецептов выбранных
+        ингредиентов склеиваются и подсчитываются np.bincount.
+        Возвращает список (id рецепта, покрытие) по убыванию покрытия,
+        при равном покрытии выше рецепты с большим числом совпадений.
+        """
+        self.refresh()
+        state = self.state
+        have = np.unique(np.array(list(ingredients), dtype=np.int64))
+        ingredient_ids = state['ingredient_ids']
+        found = np.searchsorted(ingredient_ids, have)
+        inside = found < len(ingredient_ids)
+        found = found[inside]
+        found = found[ingredient_ids[found] == have[inside]]
+        offsets, postings = state['offsets'], state['postings']
+        hits = np.bincount(
+            np.concatenate([postings[offsets[index]:offsets[index + 1]]
+                            for index in found] or [postings[:0]]),
+            minlength=len(state['recipe_ids'])
+        )
+        hits[state['stale']] = 0
+        coverage = hits / np.maximum(state['sizes'], 1)
+        candidates = np.flatnonzero((hits > 0) & (coverage >= min_coverage))
+        if len(candidates) > limit:
+            threshold = np.partition(coverage[candidates], -limit)[-limit]
+            candidates = candidates[coverage[candidates] >= threshold]
+        order = np.lexsort((-hits[candidates], -coverage[candidates]))
+        result = [
+            (int(state['recipe_ids'][position]), float(coverage[position]),
+             int(hits[position]))
+            for position in candidates[order[:limit]]
+        ]
+        have = set(have.tolist())
+        for recipe_id, recipe_ingredients in state['changed'].items():
+            matched = len(recipe_ingredients & have)
+            if not matched:
+                continue
+            share = matched / len(recipe_ingredients)
+            if share >= min_coverage:
+                result.append((recipe_id, share, matched))
+        result.sort(key=lambda item: (-item[1], -item[2]))
+        return [(recipe_id, share) for recipe_id, share, _ in result[:limit]]
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
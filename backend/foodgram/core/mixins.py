@@ -0,0 +1,21 @@
+class PreservedFieldsMixin:
+    """
+    Сохранение модели без полей, которые меняются только в базе данных.
+
+    save() существующей записи без update_fields обновляет все поля,
+    кроме preserved_fields: их значения в памяти могли устареть
+    (например, счетчики меняются одним UPDATE с F()).
+    """
+
+    preserved_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not args and not self._state.adding and self.pk is not None
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.preserved_fields
+            ]
+        super().save(*args, **kwargs)
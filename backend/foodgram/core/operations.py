@@ -0,0 +1,23 @@
+from django.db.migrations import AddIndex
+
+
+class PostgresAddIndex(AddIndex):
+    """
+    Операция миграции: индекс, создаваемый только в PostgreSQL.
+
+    Состояние моделей меняется для всех баз данных, а сам индекс
+    (GIN и подобные) создается только в PostgreSQL, чтобы миграции
+    продолжали работать в режиме SQLITE.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state,
+                                      to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state,
+                                       to_state)
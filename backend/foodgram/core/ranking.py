@@ -0,0 +1,72 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .cache import invalidate
+from .constants import (RANKING_POPULAR_HALF_LIFE_DAYS,
+                        RANKING_TRENDING_HALF_LIFE_HOURS,
+                        RANKING_TRENDING_WINDOW_DAYS, RANKING_WEIGHTS)
+from recipes.models import Favorite, RecipeRanking, ShoppingCart
+
+BATCH_SIZE = 1000
+
+
+def get_decayed_scores(now, half_life, bucket, since=None):
+    """
+    Сумма добавлений рецептов в избранное и списки покупок с затуханием.
+
+    Каждое добавление весит RANKING_WEIGHTS[модель] * 0.5 ** (возраст /
+    half_life). Добавления группируются в базе данных по рецепту
+    и интервалу bucket ('hour', 'day'), поэтому в Python приходит
+    не больше одной строки на рецепт за интервал.
+    """
+    scores = defaultdict(float)
+    for model in (Favorite, ShoppingCart):
+        weight = RANKING_WEIGHTS[model._meta.model_name]
+        queryset = model.objects.all()
+        if since is not None:
+            queryset = queryset.filter(created_at__gte=since)
+        rows = queryset.annotate(
+            period=Trunc('created_at', bucket)
+        ).order_by().values('recipe_id', 'period').annotate(
+            total=Count('pk')
+        ).values_list('recipe_id', 'period', 'total')
+        for recipe_id, period, total in rows.iterator():
+            age = max((now - period) / half_life, 0)
+            scores[recipe_id] += weight * total * 0.5 ** age
+    return scores
+
+
+def compute_rankings():
+    """
+    Пересчет таблицы RecipeRanking.
+
+    popular учитывает все добавления с полураспадом
+    RANKING_POPULAR_HALF_LIFE_DAYS, trending - добавления за последние
+    RANKING_TRENDING_WINDOW_DAYS с полураспадом
+    RANKING_TRENDING_HALF_LIFE_HOURS. В таблицу попадают только рецепты
+    с ненулевым рейтингом; таблица заменяется целиком в одной транзакции.
+    """
+    now = timezone.now()
+    popular = get_decayed_scores(
+        now, timedelta(days=RANKING_POPULAR_HALF_LIFE_DAYS), 'day'
+    )
+    trending = get_decayed_scores(
+        now, timedelta(hours=RANKING_TRENDING_HALF_LIFE_HOURS), 'hour',
+        since=now - timedelta(days=RANKING_TRENDING_WINDOW_DAYS)
+    )
+    with transaction.atomic():
+        RecipeRanking.objects.all().delete()
+        RecipeRanking.objects.bulk_create(
+            (RecipeRanking(recipe_id=recipe_id, popular=score,
+                           trending=trending.get(recipe_id, 0),
+                           computed_at=now)
+             for recipe_id, score in popular.items()),
+            batch_size=BATCH_SIZE
+        )
+    invalidate('recipes')
+    return len(popular)
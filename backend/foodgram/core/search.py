@@ -0,0 +1,106 @@
+import threading
+import time
+from bisect import bisect_left
+from operator import itemgetter
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            TrigramSimilarity)
+from django.db import connection
+from django.db.models import F, Q
+
+from .cache import get_version
+from .constants import INGREDIENT_INDEX_MAX_AGE, SEARCH_CONFIG
+from recipes.models import Ingredient
+
+
+class IngredientIndex:
+    """
+    Индекс названий ингредиентов в памяти процесса.
+
+    Хранит отсортированный по названию в нижнем регистре список
+    ингредиентов и ищет по префиксу бинарным поиском. Индекс
+    перестраивается при смене версии кэша 'ingredients', которую
+    меняют сигналы модели Ingredient (recipes.signals), и не реже чем
+    раз в INGREDIENT_INDEX_MAX_AGE секунд: при локальном кэше версия
+    из другого процесса до воркера не доходит. Ключи
+    и ингредиенты хранятся одним кортежем index и заменяются одним
+    присваиванием, поэтому параллельный поиск не смешивает старые
+    и новые списки.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.expires = 0
+        self.index = ([], [])
+
+    def build(self):
+        """Загрузка ингредиентов из базы данных."""
+        rows = sorted((
+            (name.casefold(), {'id': pk, 'name': name,
+                               'measurement_unit': measurement_unit})
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ).iterator()
+        ), key=itemgetter(0))
+        return [key for key, _ in rows], [item for _, item in rows]
+
+    def refresh(self):
+        """Перестроение индекса, если ингредиенты изменились или он устарел."""
+        version = get_version('ingredients')
+        if version == self.version and time.monotonic() < self.expires:
+            return
+        with self.lock:
+            if version != self.version or time.monotonic() >= self.expires:
+                self.index = self.build()
+                self.version = version
+                self.expires = time.monotonic() + INGREDIENT_INDEX_MAX_AGE
+
+    def search(self, query, limit, substring=False):
+        """
+        Поиск ингредиентов по началу названия без учета регистра.
+
+        При substring=True после совпадений по префиксу добавляются
+        ингредиенты, содержащие query в середине названия.
+        """
+        self.refresh()
+        keys, items = self.index
+        query = query.casefold()
+        result = []
+        position = bisect_left(keys, query)
+        while (len(result) < limit and position < len(keys)
+               and keys[position].startswith(query)):
+            result.append(items[position])
+            position += 1
+        if substring and query:
+            for key, item in zip(keys, items):
+                if len(result) >= limit:
+                    break
+                if query in key and not key.startswith(query):
+                    result.append(item)
+        return result
+
+
+ingredient_index = IngredientIndex()
+
+
+def search_recipes(queryset, query):
+    """
+    Поиск рецептов по названию и описанию.
+
+    В PostgreSQL используется полнотекстовый поиск по search_vector
+    с ранжированием SearchRank; опечатки в названии покрываются
+    триграммным сходством (pg_trgm). Оба условия обслуживаются
+    GIN-индексами. В SQLite поиск сводится к вхождению подстроки.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.filter(Q(name__icontains=query)
+                               | Q(text__icontains=query))
+    search_query = SearchQuery(query, config=SEARCH_CONFIG,
+                               search_type='websearch')
+    return queryset.annotate(
+        rank=SearchRank(F('search_vector'), search_query),
+        similarity=TrigramSimilarity('name', query)
+    ).filter(
+        Q(search_vector=search_query) | Q(name__trigram_similar=query)
+    ).order_by('-rank', '-similarity', '-pub_date')
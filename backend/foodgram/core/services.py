@@ -1,8 +1,33 @@
+import csv
+import json
+import threading
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
 from rest_framework import status
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
 from rest_framework.response import Response
 
-from .constants import COUNT_TAG_INGREDIENT
-from recipes.models import RecipeIngredient
+from .constants import (COUNT_TAG_INGREDIENT, PDF_CHUNK_SIZE, PDF_FONT,
+                        PDF_FONT_SIZE, PDF_MARGIN)
+from recipes.models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                            ShoppingCartTotal)
+from users.models import Follow, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
 
 
 def recipe_create_update(ingredients_data, recipe):
@@ -15,6 +40,128 @@ def recipe_create_update(ingredients_data, recipe):
     RecipeIngredient.objects.bulk_create(recipeingredients)
 
 
+def recipe_ingredients_update(ingredients_data, recipe):
+    """
+    Вспомогательная функция: обновление ингредиентов рецепта по разнице.
+
+    Новые строки промежуточной таблицы создаются bulk_create, измененные
+    количества обновляются bulk_update, удаленные строки удаляются одним
+    запросом; неизменные строки не затрагиваются. Возвращает разницу
+    количеств для итогов списков покупок.
+    """
+    rows = {row.ingredient_id: row for row in
+            RecipeIngredient.objects.select_for_update().filter(recipe=recipe)}
+    new_amounts = {item['id'].pk: item['amount'] for item in ingredients_data}
+    old_amounts = {ingredient_id: row.amount
+                   for ingredient_id, row in rows.items()}
+    RecipeIngredient.objects.filter(
+        recipe=recipe, ingredient_id__in=rows.keys() - new_amounts.keys()
+    ).delete()
+    changed = []
+    for ingredient_id, amount in new_amounts.items():
+        row = rows.get(ingredient_id)
+        if row is not None and row.amount != amount:
+            row.amount = amount
+            changed.append(row)
+    RecipeIngredient.objects.bulk_update(changed, ('amount',))
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                         amount=amount)
+        for ingredient_id, amount in new_amounts.items()
+        if ingredient_id not in rows
+    )
+    return get_amounts_diff(old_amounts, new_amounts)
+
+
+def get_recipe_amounts(recipe, sign=1):
+    """
+    Вспомогательная функция.
+
+    Получение словаря {id ингредиента: количество} для рецепта.
+    sign=-1 дает словарь для вычитания из итогов списка покупок.
+    """
+    return {ingredient_id: sign * amount for ingredient_id, amount
+            in recipe.recipesingredients.values_list('ingredient_id',
+                                                     'amount')}
+
+
+def get_amounts_diff(old_amounts, new_amounts):
+    """Разница количеств ингредиентов рецепта до и после изменения."""
+    return {
+        ingredient_id: (new_amounts.get(ingredient_id, 0)
+                        - old_amounts.get(ingredient_id, 0))
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+
+
+@transaction.atomic
+def change_shopping_cart_totals(user_ids, amounts):
+    """
+    Инкрементальное изменение итогов списков покупок.
+
+    amounts - словарь {id ингредиента: изменение количества}, которое
+    применяется к итогам каждого пользователя из user_ids. Строки
+    пользователей блокируются, чтобы параллельные запросы одного
+    пользователя не создавали одинаковые строки итогов.
+    """
+    amounts = {ingredient_id: amount
+               for ingredient_id, amount in amounts.items() if amount}
+    user_ids = list(user_ids)
+    if not user_ids or not amounts:
+        return
+    list(User.objects.select_for_update().filter(
+        pk__in=user_ids
+    ).order_by('pk').values_list('pk', flat=True))
+    totals = {
+        (total.user_id, total.ingredient_id): total
+        for total in ShoppingCartTotal.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=amounts
+        )
+    }
+    to_create, to_update, to_delete = [], [], []
+    for user_id in user_ids:
+        for ingredient_id, amount in amounts.items():
+            total = totals.get((user_id, ingredient_id))
+            if total is None:
+                if amount > 0:
+                    to_create.append(ShoppingCartTotal(
+                        user_id=user_id, ingredient_id=ingredient_id,
+                        amount=amount
+                    ))
+                continue
+            total.amount += amount
+            if total.amount > 0:
+                to_update.append(total)
+            else:
+                to_delete.append(total.pk)
+    ShoppingCartTotal.objects.bulk_create(to_create)
+    ShoppingCartTotal.objects.bulk_update(to_update, ('amount',))
+    ShoppingCartTotal.objects.filter(pk__in=to_delete).delete()
+
+
+def get_recipe_cart_users(recipe):
+    """Получение id пользователей, у которых рецепт в списке покупок."""
+    return ShoppingCart.objects.filter(
+        recipe=recipe
+    ).values_list('user_id', flat=True)
+
+
+def calculate_shopping_cart_totals():
+    """
+    Расчет итогов списков покупок с нуля.
+
+    Возвращает словарь {(id пользователя, id ингредиента): количество}.
+    """
+    return {
+        (total['user_id'], total['ingredient_id']): total['total']
+        for total in RecipeIngredient.objects.filter(
+            recipe__shoppingcarts__isnull=False
+        ).values(
+            'ingredient_id', user_id=F('recipe__shoppingcarts__user_id')
+        ).annotate(total=Sum('amount')).order_by().iterator()
+    }
+
+
 def get_values(related_data):
     """
     Вспомогательная функция.
@@ -26,12 +173,205 @@ def get_values(related_data):
     )
 
 
-def get_data(ingredients):
-    """Получение данных для занесения в файл со списком покупок."""
-    return [f"{ingredient['name']} - "
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def get_line(ingredient):
+    """Строка списка покупок для одного ингредиента."""
+    return (f"{ingredient['name']} - "
             f"{ingredient['amount']} "
-            f"{ingredient['measurement_unit']}\n"
-            for ingredient in ingredients]
+            f"{ingredient['measurement_unit']}")
+
+
+def get_txt_data(ingredients):
+    """Построчная генерация списка покупок в формате txt."""
+    for ingredient in ingredients:
+        yield get_line(ingredient) + '\n'
+
+
+def get_csv_data(ingredients):
+    """Построчная генерация списка покупок в формате csv."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for ingredient in ingredients:
+        yield writer.writerow((ingredient['name'], ingredient['amount'],
+                               ingredient['measurement_unit']))
+
+
+def get_json_data(ingredients):
+    """Потоковая генерация списка покупок в виде JSON-массива."""
+    yield '['
+    separator = ''
+    for ingredient in ingredients:
+        yield separator + json.dumps(
+            {'name': ingredient['name'],
+             'amount': ingredient['amount'],
+             'measurement_unit': ingredient['measurement_unit']},
+            ensure_ascii=False
+        )
+        separator = ','
+    yield ']'
+
+
+def get_pdf_data(ingredients):
+    """
+    Генерация списка покупок в формате pdf.
+
+    Строки читаются из курсора по одной и сразу выводятся на страницу;
+    в документ встраивается только подмножество глифов шрифта PDF_FONT
+    с кириллицей. Таблица смещений PDF записывается в конце файла,
+    поэтому готовый документ (несколько килобайт на страницу) отдается
+    частями по PDF_CHUNK_SIZE после вывода последней строки.
+    """
+    name, path = PDF_FONT
+    if name not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(name, str(settings.BASE_DIR / path)))
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setTitle('Список покупок')
+    width, height = A4
+    leading = PDF_FONT_SIZE * 1.5
+    top = height - PDF_MARGIN
+    pdf.setFont(name, PDF_FONT_SIZE)
+    position = top
+    for ingredient in ingredients:
+        for line in simpleSplit(get_line(ingredient), name, PDF_FONT_SIZE,
+                                width - 2 * PDF_MARGIN):
+            if position < PDF_MARGIN:
+                pdf.showPage()
+                pdf.setFont(name, PDF_FONT_SIZE)
+                position = top
+            pdf.drawString(PDF_MARGIN, position, line)
+            position -= leading
+    pdf.save()
+    buffer.seek(0)
+    yield from iter(partial(buffer.read, PDF_CHUNK_SIZE), b'')
+
+
+def get_data(ingredients, file_format='txt'):
+    """
+    Получение данных для занесения в файл со списком покупок.
+
+    Возвращает генератор, поэтому список не собирается в памяти целиком
+    и может отдаваться через StreamingHttpResponse по мере чтения
+    из базы данных.
+    """
+    generators = {
+        'txt': get_txt_data,
+        'csv': get_csv_data,
+        'json': get_json_data,
+        'pdf': get_pdf_data,
+    }
+    return generators[file_format](ingredients)
+
+
+def change_counters(instance, delta):
+    """
+    Вспомогательная функция: изменение счетчиков, зависящих от instance.
+
+    Счетчик меняется одним UPDATE с F(), поэтому одновременные запросы
+    не теряют изменений; значение не опускается ниже нуля.
+    """
+    for model, field, related_model, related_field in COUNTERS:
+        if isinstance(instance, related_model):
+            model.objects.filter(
+                pk=getattr(instance, f'{related_field}_id')
+            ).update(**{field: Greatest(F(field) + delta, 0)})
+
+
+cascade = threading.local()
+
+
+def get_deleted_objects():
+    """Вспомогательная функция: удаляемые рецепты и пользователи потока."""
+    if not hasattr(cascade, 'objects'):
+        cascade.objects = set()
+    return cascade.objects
+
+
+def start_cascade(instance):
+    """
+    Вспомогательная функция: счетчики перед удалением рецепта или автора.
+
+    Строки, удаляемые каскадом вместе с instance, уменьшают счетчики
+    оставшихся объектов сгруппированно, одним UPDATE на счетчик:
+    связи уникальны, поэтому каждый объект теряет ровно одну строку.
+    Счетчики самого instance не меняются, он удаляется.
+    """
+    get_deleted_objects().add((instance._meta.label, instance.pk))
+    for model, field, related_model, related_field in COUNTERS:
+        for relation in related_model._meta.concrete_fields:
+            if (relation.name == related_field or not relation.is_relation
+                    or not isinstance(instance, relation.related_model)):
+                continue
+            model.objects.filter(
+                pk__in=related_model.objects.filter(
+                    **{relation.name: instance.pk}
+                ).values(f'{related_field}_id')
+            ).update(**{field: Greatest(F(field) - 1, 0)})
+
+
+def finish_cascade(instance):
+    """Вспомогательная функция: завершение удаления рецепта или автора."""
+    get_deleted_objects().discard((instance._meta.label, instance.pk))
+
+
+def is_cascaded(instance):
+    """
+    Вспомогательная функция: строка удалена каскадом (start_cascade).
+
+    Ее счетчики уже учтены перед удалением или удаляются вместе
+    с объектом.
+    """
+    deleted = get_deleted_objects()
+    return any(
+        (field.related_model._meta.label, getattr(instance, field.attname))
+        in deleted
+        for field in instance._meta.concrete_fields if field.is_relation
+    )
+
+
+def reconcile_counters(check=False):
+    """
+    Сверка счетчиков (COUNTERS) с фактическим числом связанных строк.
+
+    Возвращает число расхождений по каждому счетчику; без check
+    расхождения исправляются.
+    """
+    mismatches = {}
+    for model, field, related_model, related_field in COUNTERS:
+        actual = Coalesce(Subquery(
+            related_model.objects.filter(
+                **{related_field: OuterRef('pk')}
+            ).order_by().values(related_field).annotate(
+                total=Count('pk')
+            ).values('total')
+        ), 0)
+        wrong = model.objects.exclude(**{field: actual})
+        key = f'{model._meta.model_name}.{field}'
+        mismatches[key] = (wrong.count() if check
+                           else wrong.update(**{field: actual}))
+    return mismatches
+
+
+def get_subscriptions(request):
+    """
+    Вспомогательная функция.
+
+    Получение id авторов, на которых подписан текущий пользователь.
+    Множество загружается одним запросом и хранится в request до конца
+    обработки запроса.
+    """
+    if not hasattr(request, 'subscriptions'):
+        request.subscriptions = set(
+            request.user.user_subscriptions.values_list('author_id',
+                                                        flat=True)
+        )
+    return request.subscriptions
 
 
 def delete_favorite_shopping(user, recipe, model, name):
@@ -40,7 +380,11 @@ def delete_favorite_shopping(user, recipe, model, name):
 
     Удаление рецепта из списка покупок/избранного.
     """
-    delete, _ = model.objects.filter(user=user, recipe=recipe).delete()
+    with transaction.atomic():
+        delete, _ = model.objects.filter(user=user, recipe=recipe).delete()
+        if delete and model is ShoppingCart:
+            change_shopping_cart_totals((user.id,),
+                                        get_recipe_amounts(recipe, -1))
     return Response(
         f'Рецепт успешно удален из {name}' if delete
         else f'Ошибка удаления из {name}',
@@ -0,0 +1,161 @@
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+from scipy import sparse
+
+from .cache import invalidate
+from .constants import (SIMILAR_BATCH_SIZE, SIMILAR_RECIPES_COUNT,
+                        SIMILAR_REFRESH_MARGIN)
+from recipes.models import Recipe, RecipeIngredient, RecipeNeighbor
+
+
+def get_matrix(queryset, recipe_ids):
+    """Разреженная матрица рецепт x признак (значение 1) по парам id."""
+    values = np.array(list(queryset.order_by().iterator()),
+                      dtype=np.int64).reshape(-1, 2)
+    values = values[np.isin(values[:, 0], recipe_ids)]
+    keys, codes = np.unique(values[:, 1], return_inverse=True)
+    return sparse.csr_matrix(
+        (np.ones(len(values), dtype=np.float32),
+         (np.searchsorted(recipe_ids, values[:, 0]), codes)),
+        shape=(len(recipe_ids), len(keys))
+    )
+
+
+def build_features():
+    """
+    Признаки рецептов: id рецептов в порядке строк, матрицы
+    ингредиентов и тегов и число признаков каждого рецепта.
+    """
+    recipe_ids = np.array(sorted(Recipe.objects.values_list('pk', flat=True)),
+                          dtype=np.int64)
+    ingredients = get_matrix(
+        RecipeIngredient.objects.values_list('recipe_id', 'ingredient_id'),
+        recipe_ids
+    )
+    tags = get_matrix(
+        Recipe.tags.through.objects.values_list('recipe_id', 'tag_id'),
+        recipe_ids
+    )
+    sizes = (np.asarray(ingredients.sum(axis=1)).ravel()
+             + np.asarray(tags.sum(axis=1)).ravel())
+    return recipe_ids, (ingredients, tags, sizes)
+
+
+def get_scores(features, positions):
+    """
+    Коэффициенты Жаккара строк positions с остальными рецептами.
+
+    J = |A ∩ B| / (|A| + |B| - |A ∩ B|) по ингредиентам и тегам.
+    Кандидаты - рецепты с общими ингредиентами: их дает одно
+    произведение разреженных матриц ингредиентов. Общие теги
+    досчитываются только для найденных пар, иначе из-за малого числа
+    тегов почти каждая пара рецептов стала бы кандидатом. Результат -
+    матрица COO с парами кандидатов.
+    """
+    ingredients, tags, sizes = features
+    overlap = (ingredients[positions] @ ingredients.T).tocoo()
+    rows = positions[overlap.row]
+    common = overlap.data + np.asarray(
+        tags[rows].multiply(tags[overlap.col]).sum(axis=1)
+    ).ravel()
+    overlap.data = common / (sizes[rows] + sizes[overlap.col] - common)
+    return overlap
+
+
+def get_neighbors(features, positions, limit):
+    """Не больше limit ближайших рецептов для каждой строки positions."""
+    scores = get_scores(features, positions).tocsr()
+    result = []
+    for index, position in enumerate(positions):
+        start, end = scores.indptr[index], scores.indptr[index + 1]
+        columns = scores.indices[start:end]
+        values = np.where(columns == position, 0, scores.data[start:end])
+        if len(values) > limit:
+            top = np.argpartition(-values, limit)[:limit]
+            columns, values = columns[top], values[top]
+        order = np.argsort(-values, kind='stable')
+        result.append([(int(columns[item]), float(values[item]))
+                       for item in order if values[item] > 0])
+    return result
+
+
+def get_affected(features, recipe_ids, changed, limit):
+    """
+    Рецепты, соседей которых нужно пересчитать после изменения changed.
+
+    Кроме самих измененных рецептов это рецепты, у которых измененный
+    рецепт уже есть среди соседей (его коэффициент мог уменьшиться),
+    и рецепты, в список соседей которых он теперь проходит: коэффициент
+    выше наименьшего сохраненного или соседей меньше limit.
+    """
+    affected = set(changed.tolist())
+    neighbor_of = np.array(list(RecipeNeighbor.objects.filter(
+        neighbor_id__in=recipe_ids[changed].tolist()
+    ).values_list('recipe_id', flat=True)), dtype=np.int64)
+    neighbor_of = neighbor_of[np.isin(neighbor_of, recipe_ids)]
+    affected.update(np.searchsorted(recipe_ids, neighbor_of).tolist())
+    lowest = np.zeros(len(recipe_ids))
+    counts = np.zeros(len(recipe_ids), dtype=np.int64)
+    for recipe_id, score, count in RecipeNeighbor.objects.order_by().values(
+        'recipe_id'
+    ).annotate(
+        lowest=Min('score'), total=Count('pk')
+    ).values_list('recipe_id', 'lowest', 'total').iterator():
+        position = np.searchsorted(recipe_ids, recipe_id)
+        if position < len(recipe_ids) and recipe_ids[position] == recipe_id:
+            lowest[position], counts[position] = score, count
+    for start in range(0, len(changed), SIMILAR_BATCH_SIZE):
+        scores = get_scores(features,
+                            changed[start:start + SIMILAR_BATCH_SIZE])
+        columns = scores.col
+        affected.update(columns[
+            (scores.data > lowest[columns]) | (counts[columns] < limit)
+        ].tolist())
+    return np.array(sorted(affected), dtype=np.int64)
+
+
+def compute_neighbors(full=False):
+    """
+    Пересчет таблицы похожих рецептов RecipeNeighbor.
+
+    Без full пересчитываются только рецепты, затронутые изменениями
+    с прошлого запуска (по Recipe.updated_at с запасом
+    SIMILAR_REFRESH_MARGIN, get_affected); первый запуск всегда полный.
+    Рецепты обрабатываются пачками по SIMILAR_BATCH_SIZE, чтобы
+    ограничить размер произведения матриц. Возвращает число
+    пересчитанных рецептов.
+    """
+    started = timezone.now()
+    recipe_ids, features = build_features()
+    last = RecipeNeighbor.objects.aggregate(last=Max('computed_at'))['last']
+    if full or last is None:
+        positions = np.arange(len(recipe_ids))
+    else:
+        changed = np.array(list(Recipe.objects.filter(
+            updated_at__gte=last - timedelta(seconds=SIMILAR_REFRESH_MARGIN)
+        ).values_list('pk', flat=True)), dtype=np.int64)
+        changed = np.searchsorted(recipe_ids,
+                                  changed[np.isin(changed, recipe_ids)])
+        positions = get_affected(features, recipe_ids, changed,
+                                 SIMILAR_RECIPES_COUNT)
+    for start in range(0, len(positions), SIMILAR_BATCH_SIZE):
+        batch = positions[start:start + SIMILAR_BATCH_SIZE]
+        neighbors = get_neighbors(features, batch, SIMILAR_RECIPES_COUNT)
+        with transaction.atomic():
+            RecipeNeighbor.objects.filter(
+                recipe_id__in=recipe_ids[batch].tolist()
+            ).delete()
+            RecipeNeighbor.objects.bulk_create(
+                RecipeNeighbor(recipe_id=int(recipe_ids[position]),
+                               neighbor_id=int(recipe_ids[column]),
+                               score=score, computed_at=started)
+                for position, items in zip(batch, neighbors)
+                for column, score in items
+            )
+    if len(positions):
+        invalidate('recipes')
+    return len(positions)
@@ -3,6 +3,8 @@ import re
 from django.core.exceptions import ValidationError
 from rest_framework import serializers
 
+from .constants import MATCH_LIMIT, MATCH_MAX_INGREDIENTS
+
 
 def validate_username(value):
     """Валидация поля username."""
@@ -27,3 +29,57 @@ def validate_fields(value, name_1, name_2, key1=None):
             f'Нельзя добавлять одинаковые {name_2}!'
         )
     return value
+
+
+def validate_recipes_limit(request):
+    """Валидация параметра запроса recipes_limit."""
+    if 'recipes_limit' not in request.query_params:
+        return None
+    try:
+        recipes_limit = int(request.query_params['recipes_limit'])
+    except ValueError:
+        raise serializers.ValidationError(
+            'Параметр recipes_limit не является числом.'
+        )
+    if recipes_limit < 0:
+        raise serializers.ValidationError(
+            'Параметр recipes_limit не может быть отрицательным.'
+        )
+    return recipes_limit
+
+
+def validate_match_params(request):
+    """
+    Валидация параметров запроса подбора рецептов по ингредиентам.
+
+    ingredients - id ингредиентов (параметр можно повторять или
+    перечислить id через запятую), limit - число рецептов,
+    min_coverage - минимальная доля имеющихся ингредиентов рецепта.
+    """
+    values = [value for param in request.query_params.getlist('ingredients')
+              for value in param.split(',') if value.strip()]
+    if not values:
+        raise serializers.ValidationError(
+            'Укажите id ингредиентов в параметре ingredients.'
+        )
+    if len(values) > MATCH_MAX_INGREDIENTS:
+        raise serializers.ValidationError(
+            f'Можно указать не больше {MATCH_MAX_INGREDIENTS} ингредиентов.'
+        )
+    try:
+        ingredients = {int(value) for value in values}
+        limit = int(request.query_params.get('limit', MATCH_LIMIT))
+        min_coverage = float(request.query_params.get('min_coverage', 0))
+    except ValueError:
+        raise serializers.ValidationError(
+            'Параметры ingredients, limit и min_coverage должны быть числами.'
+        )
+    if not 1 <= limit <= MATCH_LIMIT:
+        raise serializers.ValidationError(
+            f'Параметр limit должен быть от 1 до {MATCH_LIMIT}.'
+        )
+    if not 0 <= min_coverage <= 1:
+        raise serializers.ValidationError(
+            'Параметр min_coverage должен быть от 0 до 1.'
+        )
+    return ingredients, limit, min_coverage
@@ -5,6 +5,7 @@ from django.utils.safestring import mark_safe
 from .models import (Ingredient, Favorite, Recipe, RecipeIngredient,
                      ShoppingCart, Tag, URL)
 from core.constants import MIN_COUNT
+from core.images import get_variants
 from core.services import get_values
 
 
@@ -31,23 +32,22 @@ class IngredientInline(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'author', 'favorite', 'get_image',
-                    'get_ingredients', 'get_tags')
+    list_display = ('id', 'name', 'author', 'favorites_count',
+                    'in_carts_count', 'get_image', 'get_ingredients',
+                    'get_tags')
     search_fields = ('name', 'author__username')
     list_filter = ('tags',)
     list_display_links = ('id', 'name')
-    readonly_fields = ('favorite', 'get_image')
+    readonly_fields = ('get_image',)
     fields = ('author', 'name', 'text', 'get_image', 'image', 'cooking_time',
               'tags')
     inlines = (IngredientInline,)
 
-    @admin.display(description='Число добавлений рецепта в избранное')
-    def favorite(self, obj):
-        return obj.favorites.count()
-
     @admin.display(description='Миниатюра картинки')
     def get_image(self, obj):
-        return mark_safe(f'<img src={obj.image.url} width="80" height="60">')
+        thumbnail = get_variants(obj, 'image').get('thumbnail')
+        url = obj.image.storage.url(thumbnail) if thumbnail else obj.image.url
+        return mark_safe(f'<img src={url} width="80" height="60">')
 
     @admin.display(description='Ингредиенты')
     def get_ingredients(self, obj):
@@ -0,0 +1,96 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.pagination import FeedPagination
+from core.benchmark import (BENCH_PREFIX, explain, seed_benchmark_data,
+                            timed)
+from core.constants import PAGE_SIZE
+from recipes.models import Recipe
+from users.models import Follow, User
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает стратегии ленты подписок (in и merge) для разного '
+            'числа подписок: время первой страницы и страницы на глубине '
+            '--depth. Подписки создаются во временной транзакции.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-users', type=int, default=0,
+                            help='Создать пользователей для бенчмарка.')
+        parser.add_argument('--seed-recipes', type=int, default=0,
+                            help='Создать рецепты для бенчмарка.')
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=(10, 100, 1000, 5000),
+                            help='Число подписок.')
+        parser.add_argument('--depth', type=int, default=20,
+                            help='Номер страницы для второго замера.')
+        parser.add_argument('--explain', action='store_true',
+                            help='Выводить планы запросов.')
+
+    def get_page(self, user, position, strategy):
+        pagination = FeedPagination()
+        pagination.ordering = pagination.cursor_ordering
+        queryset = Recipe.objects.filter(Recipe.objects.get_feed_filter(
+            user, position, PAGE_SIZE + 1, strategy
+        ))
+        if position is not None:
+            queryset = queryset.filter(
+                pagination.get_keyset_filter(position)
+            )
+        return queryset.order_by(*pagination.ordering)[:PAGE_SIZE + 1]
+
+    def get_position(self, user, depth):
+        """Позиция курсора перед страницей depth."""
+        position = None
+        for _ in range(depth - 1):
+            page = list(self.get_page(user, position, 'in'))[:PAGE_SIZE]
+            if len(page) < PAGE_SIZE:
+                return None
+            position = [page[-1].pub_date, page[-1].pk]
+        return position
+
+    def handle(self, *args, **options):
+        if options['seed_recipes']:
+            try:
+                seed_benchmark_data(max(options['seed_users'], 1),
+                                    options['seed_recipes'])
+            except ValueError as error:
+                raise CommandError(error)
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+        authors = list(User.objects.filter(
+            recipes_count__gt=0
+        ).order_by('pk').values_list('pk', flat=True))
+        user = User.objects.filter(
+            username__startswith=BENCH_PREFIX
+        ).order_by('pk').first() or User.objects.order_by('pk').first()
+        if user is None or not authors:
+            raise CommandError('В базе данных нет рецептов.')
+        strategies = ['in']
+        if connection.vendor == 'postgresql':
+            strategies.append('merge')
+        for size in options['sizes']:
+            with transaction.atomic():
+                Follow.objects.filter(user=user).delete()
+                Follow.objects.bulk_create(
+                    Follow(user=user, author_id=author_id)
+                    for author_id in authors[:size] if author_id != user.pk
+                )
+                count = Follow.objects.filter(user=user).count()
+                position = self.get_position(user, options['depth'])
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f'Подписок: {count}'
+                ))
+                for strategy in strategies:
+                    first = self.get_page(user, None, strategy)
+                    deep = self.get_page(user, position, strategy)
+                    self.stdout.write(
+                        f'{strategy}: первая страница '
+                        f'{timed(lambda: list(first.all())):.2f} мс, '
+                        f'страница {options["depth"]} '
+                        f'{timed(lambda: list(deep.all())):.2f} мс'
+                    )
+                    if options['explain']:
+                        self.stdout.write(explain(deep))
+                transaction.set_rollback(True)
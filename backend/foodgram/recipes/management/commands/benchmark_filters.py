@@ -0,0 +1,85 @@
+from itertools import combinations
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+
+from api.filters import RecipeFilter
+from core.benchmark import (BENCH_PREFIX, clear_benchmark_data, explain,
+                            seed_benchmark_data, timed)
+from core.constants import PAGE_SIZE
+from recipes.models import Recipe, Tag
+from users.models import User
+
+FILTERS = ('author', 'tags', 'tags_all', 'is_favorited',
+           'is_in_shopping_cart')
+
+
+class Command(BaseCommand):
+    help = ('Выводит EXPLAIN (ANALYZE в PostgreSQL) и время выполнения '
+            'запросов списка рецептов для всех сочетаний фильтров '
+            'RecipeFilter.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-users', type=int, default=0,
+                            help='Создать пользователей для бенчмарка.')
+        parser.add_argument('--seed-recipes', type=int, default=0,
+                            help='Создать рецепты для бенчмарка.')
+        parser.add_argument('--clear', action='store_true',
+                            help='Удалить данные бенчмарка и выйти.')
+        parser.add_argument('--no-explain', action='store_true',
+                            help='Выводить только время выполнения.')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted = clear_benchmark_data()
+            self.stdout.write(self.style.SUCCESS(
+                f'Удалено объектов: {deleted}.'
+            ))
+            return
+        if options['seed_recipes']:
+            try:
+                users, recipes = seed_benchmark_data(
+                    max(options['seed_users'], 1), options['seed_recipes']
+                )
+            except ValueError as error:
+                raise CommandError(error)
+            self.stdout.write(self.style.SUCCESS(
+                f'Создано пользователей: {users}, рецептов: {recipes}.'
+            ))
+        user = User.objects.filter(
+            username__startswith=BENCH_PREFIX
+        ).order_by('pk').first() or User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError('В базе данных нет пользователей.')
+        author = User.objects.order_by('-recipes_count').first()
+        values = {
+            'author': str(author.pk),
+            'tags': list(Tag.objects.values_list('slug', flat=True)[:2]),
+            'tags_all': list(Tag.objects.values_list('slug', flat=True)[:2]),
+            'is_favorited': '1',
+            'is_in_shopping_cart': '1',
+        }
+        request = SimpleNamespace(user=user)
+        for size in range(len(FILTERS) + 1):
+            for names in combinations(FILTERS, size):
+                data = QueryDict(mutable=True)
+                for name in names:
+                    if isinstance(values[name], list):
+                        data.setlist(name, values[name])
+                    else:
+                        data[name] = values[name]
+                queryset = RecipeFilter(
+                    data, queryset=Recipe.objects.with_annotation(user),
+                    request=request
+                ).qs
+                page = queryset[:PAGE_SIZE]
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f'Фильтры: {", ".join(names) or "нет"}'
+                ))
+                self.stdout.write(
+                    f'count: {timed(queryset.count):.2f} мс, '
+                    f'страница: {timed(lambda: list(page.all())):.2f} мс'
+                )
+                if not options['no_explain']:
+                    self.stdout.write(explain(page))
@@ -0,0 +1,91 @@
+import base64
+import io
+import os
+import resource
+import subprocess
+import sys
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.views import UserViewSet
+from users.models import User
+
+MODES = ('base64', 'multipart')
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пиковое потребление памяти при загрузке аватара '
+            'в base64 (JSON) и через multipart/form-data. Каждый режим '
+            'запускается в отдельном процессе; изменения откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10,
+                            help='Размер картинки в МБ.')
+        parser.add_argument('--mode', choices=MODES,
+                            help='Запустить только один режим в текущем '
+                                 'процессе.')
+
+    def make_image(self, size):
+        """PNG из случайного шума: почти не сжимается, размер ~ size МБ."""
+        side = int((size * 1024 * 1024 / 3) ** 0.5)
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (side, side),
+                        os.urandom(side * side * 3)).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def run_mode(self, mode, size):
+        user = User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError('В базе данных нет пользователей.')
+        content = self.make_image(size)
+        factory = APIRequestFactory(SERVER_NAME=settings.ALLOWED_HOSTS[0])
+        if mode == 'base64':
+            request = factory.put('/api/users/me/avatar/', {
+                'avatar': 'data:image/png;base64,'
+                + base64.b64encode(content).decode()
+            }, format='json')
+        else:
+            image = io.BytesIO(content)
+            image.name = 'avatar.png'
+            request = factory.put('/api/users/me/avatar/',
+                                  {'avatar': image}, format='multipart')
+        body_size = int(request.META['CONTENT_LENGTH'])
+        force_authenticate(request, user=user)
+        view = UserViewSet.as_view({'put': 'avatar'})
+        del content
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        tracemalloc.start()
+        with transaction.atomic():
+            response = view(request)
+            avatar = User.objects.get(pk=user.pk).avatar
+            if response.status_code == 200 and avatar:
+                avatar.storage.delete(avatar.name)
+            transaction.set_rollback(True)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+        self.stdout.write(
+            f'{mode}: тело запроса {body_size / 2 ** 20:.1f} МБ, '
+            f'статус {response.status_code}, '
+            f'пик выделений Python {peak / 2 ** 20:.1f} МБ, '
+            f'рост пикового RSS {rss / 1024:.1f} МБ'
+        )
+
+    def handle(self, *args, **options):
+        if options['mode']:
+            self.run_mode(options['mode'], options['size'])
+            return
+        for mode in MODES:
+            result = subprocess.run(
+                (sys.executable, sys.argv[0], 'benchmark_uploads',
+                 '--mode', mode, '--size', str(options['size'])),
+                capture_output=True, text=True
+            )
+            if result.returncode:
+                raise CommandError(result.stderr)
+            self.stdout.write(result.stdout, ending='')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.ranking import compute_rankings
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинги рецептов (ordering=popular и '
+            '/api/recipes/trending/) по добавлениям в избранное и списки '
+            'покупок. Запускайте периодически, например из cron.')
+
+    def handle(self, *args, **options):
+        count = compute_rankings()
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинги пересчитаны, рецептов в рейтинге: {count}.'
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core.similarity import compute_neighbors
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает похожие рецепты (/api/recipes/<id>/similar/) по '
+            'ингредиентам и тегам. Без --full пересчитываются только '
+            'рецепты, затронутые изменениями с прошлого запуска.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать все рецепты.')
+
+    def handle(self, *args, **options):
+        count = compute_neighbors(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {count}.'
+        ))
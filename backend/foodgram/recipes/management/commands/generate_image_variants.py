@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from core.images import generate_variants, get_variants
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Создает варианты картинок рецептов и аватаров, которых еще '
+            'нет. С --force пересоздает все варианты.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать существующие варианты.')
+
+    def handle(self, *args, **options):
+        created = failed = 0
+        for model, field_name in ((Recipe, 'image'), (User, 'avatar')):
+            queryset = model.objects.exclude(
+                **{field_name: ''}
+            ).exclude(**{f'{field_name}__isnull': True}).only(
+                'pk', field_name, f'{field_name}_variants'
+            )
+            for instance in queryset.iterator():
+                if not options['force'] and get_variants(instance,
+                                                         field_name):
+                    continue
+                if generate_variants(model, instance.pk, field_name):
+                    created += 1
+                else:
+                    failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {created}, с ошибками: {failed}.'
+        ))
@@ -3,6 +3,7 @@ import csv
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
+from core.cache import invalidate
 from recipes.models import Ingredient
 
 
@@ -18,6 +19,7 @@ class Command(BaseCommand):
                 Ingredient.objects.bulk_create(
                     ingredients, ignore_conflicts=True
                 )
+                invalidate('ingredients', 'recipes')
             self.stdout.write(self.style.SUCCESS('Ингредиенты добавлены.'))
         except FileNotFoundError:
             self.stdout.write(self.style.ERROR('Проблемы с открытием файла.'))
@@ -3,6 +3,7 @@ import csv
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
+from core.cache import invalidate
 from recipes.models import Tag
 
 
@@ -16,6 +17,7 @@ class Command(BaseCommand):
                 Tag.objects.bulk_create(
                     tags, ignore_conflicts=True
                 )
+                invalidate('tags', 'recipes')
             self.stdout.write(self.style.SUCCESS('Теги добавлены.'))
         except FileNotFoundError:
             self.stdout.write(self.style.ERROR('Проблемы с открытием файла.'))
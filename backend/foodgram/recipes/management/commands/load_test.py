@@ -0,0 +1,66 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+PATHS = ('/api/recipes/', '/api/recipes/?limit=6&page=2', '/api/tags/',
+         '/api/ingredients/?name=мо')
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест эндпоинтов чтения запущенного сервера. '
+            'Для сравнения режимов WSGI и ASGI запустите команду против '
+            'каждого из них с одинаковыми параметрами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000',
+                            help='Адрес сервера.')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Путь запроса (можно указать несколько).')
+        parser.add_argument('--concurrency', type=int, default=20,
+                            help='Число одновременных клиентов.')
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Число запросов на каждый путь.')
+        parser.add_argument('--token', help='Токен авторизации.')
+
+    def fetch(self, url, headers):
+        start = time.perf_counter()
+        try:
+            with urlopen(Request(url, headers=headers), timeout=30) as answer:
+                answer.read()
+                status = answer.status
+        except HTTPError as error:
+            status = error.code
+        except URLError:
+            status = None
+        return status, (time.perf_counter() - start) * 1000
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 2:
+            raise CommandError('Нужен хотя бы один клиент и два запроса.')
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            for path in options['paths'] or PATHS:
+                url = options['url'].rstrip('/') + quote(path, safe='/?&=%')
+                start = time.perf_counter()
+                results = list(executor.map(
+                    lambda _: self.fetch(url, headers),
+                    range(options['requests'])
+                ))
+                elapsed = time.perf_counter() - start
+                timings = [timing for _, timing in results]
+                errors = sum(status != 200 for status, _ in results)
+                percentiles = quantiles(timings, n=100, method='inclusive')
+                p50, p95, p99 = (percentiles[index] for index in (49, 94, 98))
+                self.stdout.write(self.style.MIGRATE_HEADING(path))
+                self.stdout.write(
+                    f'запросов/с: {len(results) / elapsed:.1f}, '
+                    f'p50: {p50:.1f} мс, p95: {p95:.1f} мс, '
+                    f'p99: {p99:.1f} мс, ошибок: {errors}'
+                )
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.services import calculate_shopping_cart_totals
+from recipes.models import ShoppingCartTotal
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает таблицу итогов списков покупок по рецептам '
+            'в списках покупок. С --check только сверяет таблицу.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить, без изменения данных.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = calculate_shopping_cart_totals()
+            if options['check']:
+                stored = {
+                    (user_id, ingredient_id): amount
+                    for user_id, ingredient_id, amount in
+                    ShoppingCartTotal.objects.values_list(
+                        'user_id', 'ingredient_id', 'amount'
+                    ).iterator()
+                }
+                mismatches = [
+                    key for key in expected.keys() | stored.keys()
+                    if expected.get(key) != stored.get(key)
+                ]
+                for user_id, ingredient_id in sorted(mismatches):
+                    self.stdout.write(
+                        f'Пользователь {user_id}, ингредиент '
+                        f'{ingredient_id}: ожидается '
+                        f'{expected.get((user_id, ingredient_id))}, '
+                        f'в таблице {stored.get((user_id, ingredient_id))}'
+                    )
+                if mismatches:
+                    self.stdout.write(self.style.ERROR(
+                        f'Найдено расхождений: {len(mismatches)}.'
+                    ))
+                else:
+                    self.stdout.write(self.style.SUCCESS(
+                        'Итоги списков покупок совпадают.'
+                    ))
+                return
+            ShoppingCartTotal.objects.all().delete()
+            ShoppingCartTotal.objects.bulk_create(
+                (ShoppingCartTotal(user_id=user_id,
+                                   ingredient_id=ingredient_id,
+                                   amount=amount)
+                 for (user_id, ingredient_id), amount in expected.items()),
+                batch_size=1000
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Итоги списков покупок пересчитаны.'
+        ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.services import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счетчики рецептов и пользователей (избранное, списки '
+            'покупок, рецепты, подписчики) с данными и исправляет '
+            'расхождения. С --check только сверяет счетчики.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить, без изменения данных.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            mismatches = reconcile_counters(check=options['check'])
+        for counter, count in mismatches.items():
+            if count:
+                self.stdout.write(f'{counter}: расхождений {count}')
+        total = sum(mismatches.values())
+        if not total:
+            self.stdout.write(self.style.SUCCESS('Счетчики совпадают.'))
+        elif options['check']:
+            self.stdout.write(self.style.ERROR(
+                f'Найдено расхождений: {total}.'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено счетчиков: {total}.'
+            ))
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:06
+
+import re
+
+import short_url
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_recipes(apps, schema_editor):
+    """
+    Привязка коротких ссылок к рецептам.
+
+    Рецепт определяется по хэшу, а если хэш не декодируется - по адресу
+    ссылки. Для каждого рецепта остается одна ссылка с хэшем из его id,
+    ссылки на удаленные рецепты удаляются.
+    """
+    URL = apps.get_model('recipes', 'URL')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    recipe_ids = set(Recipe.objects.values_list('id', flat=True))
+    linked = set()
+    for link in URL.objects.order_by('pk'):
+        try:
+            recipe_id = short_url.decode_url(link.hash)
+        except ValueError:
+            recipe_id = None
+        if recipe_id not in recipe_ids:
+            match = re.search(r'/recipes/(\d+)', link.url)
+            recipe_id = int(match.group(1)) if match else None
+        if recipe_id not in recipe_ids or recipe_id in linked:
+            link.delete()
+            continue
+        linked.add(recipe_id)
+        link.recipe_id = recipe_id
+        link.hash = f'tmp-{link.pk}'
+        link.save(update_fields=('recipe', 'hash'))
+    for link in URL.objects.all():
+        link.hash = short_url.encode_url(link.recipe_id)
+        link.save(update_fields=('hash',))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_tags_mask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='url',
+            name='recipe',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='short_link', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.RunPython(link_recipes, migrations.RunPython.noop),
+    ]
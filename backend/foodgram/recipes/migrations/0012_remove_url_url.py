@@ -0,0 +1,27 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_url_recipe'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='url',
+            name='recipe',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='short_link', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='url',
+            name='unique_hash_url',
+        ),
+        migrations.RemoveField(
+            model_name='url',
+            name='url',
+        ),
+    ]
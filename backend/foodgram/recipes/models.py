@@ -1,17 +1,35 @@
-from django.db import models
-from django.db.models import Subquery, OuterRef, Exists
+import short_url
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connection, models
+from django.db.models import Subquery, OuterRef, Exists, Prefetch, Q
+from django.db.models.expressions import RawSQL
 from django.core.validators import MinValueValidator, MaxValueValidator
 
-from core.constants import (LENGTH, LENGTH_MEASUREMENT_UNIT, MAX_LENGTH,
+from core.constants import (FEED_FANOUT_THRESHOLD, LENGTH,
+                            LENGTH_MEASUREMENT_UNIT, MAX_LENGTH,
                             MAX_INGREDIENT_LENGTH, MAX_TAG_LENGTH,
-                            MAX_COUNT, MIN_COUNT)
-from users.models import User
+                            MAX_COUNT, MIN_COUNT, SEARCH_CONFIG,
+                            TAG_MASK_BITS)
+from core.mixins import PreservedFieldsMixin
+from users.models import Follow, User
 
 
 class RecipeManager(models.Manager):
+    @staticmethod
+    def get_prefetches():
+        """Связанные объекты, необходимые для вывода рецепта."""
+        return (
+            'tags',
+            Prefetch('recipesingredients',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient'
+                     ))
+        )
+
     def with_relation(self):
         return self.select_related('author').prefetch_related(
-            'ingredients', 'tags'
+            *self.get_prefetches()
         )
 
     def with_annotation(self, user):
@@ -26,6 +44,84 @@ class RecipeManager(models.Manager):
             ))
         ).order_by('-pub_date')
 
+    def latest_by_author(self, limit=None):
+        """
+        Последние рецепты каждого автора.
+
+        Предназначен для Prefetch: выборка ограничивается limit рецептами
+        на автора коррелированным подзапросом, поэтому рецепты всех авторов
+        страницы загружаются одним запросом.
+        """
+        queryset = self.order_by('-pub_date')
+        if limit is None:
+            return queryset
+        return queryset.filter(pk__in=Subquery(
+            self.filter(
+                author_id=OuterRef('author_id')
+            ).order_by('-pub_date').values('pk')[:limit]
+        ))
+
+    def get_feed_filter(self, user, position=None, limit=None,
+                        strategy=None):
+        """
+        Условие выборки рецептов авторов, на которых подписан user.
+
+        Стратегия 'in' - author_id IN (подписки): подходит, пока подписок
+        немного. Стратегия 'merge' (только PostgreSQL) для каждого автора
+        берет по индексу (author, -pub_date) не больше limit рецептов после
+        позиции курсора position, после чего они сливаются общей
+        сортировкой: объем работы ограничен числом подписок * limit.
+        По умолчанию 'merge' выбирается, если подписок больше
+        FEED_FANOUT_THRESHOLD. Дополнительные фильтры выборки в 'merge'
+        применяются уже после limit и укорачивают страницу.
+        """
+        followed = Follow.objects.filter(user=user)
+        if strategy is None:
+            strategy = 'in'
+            if (limit is not None and connection.vendor == 'postgresql'
+                    and followed.count() > FEED_FANOUT_THRESHOLD):
+                strategy = 'merge'
+        if strategy == 'in':
+            return Q(author_id__in=followed.values('author_id'))
+        condition, params = '', []
+        if position is not None:
+            condition = ' AND (r.pub_date, r.id) < (%s::timestamptz, %s)'
+            params = list(position)
+        return Q(pk__in=RawSQL(
+            f'SELECT top.id FROM {Follow._meta.db_table} f '
+            f'CROSS JOIN LATERAL (SELECT r.id FROM {Recipe._meta.db_table} r '
+            f'WHERE r.author_id = f.author_id{condition} '
+            f'ORDER BY r.pub_date DESC, r.id DESC LIMIT %s) top '
+            f'WHERE f.user_id = %s',
+            (*params, limit, user.pk)
+        ))
+
+    def update_search_vector(self, *pks):
+        """
+        Обновление поискового вектора рецептов.
+
+        Название входит в вектор с весом A, описание - с весом B.
+        Вектор поддерживается только в PostgreSQL.
+        """
+        if connection.vendor != 'postgresql':
+            return
+        self.filter(pk__in=pks).update(search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+        ))
+
+    def update_tags_mask(self, *pks):
+        """Пересчет битовой маски тегов рецептов."""
+        masks = dict.fromkeys(pks, 0)
+        for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe_id__in=pks
+        ).values_list('recipe_id', 'tag_id'):
+            masks[recipe_id] |= Tag.get_bit(tag_id)
+        self.bulk_update(
+            [Recipe(pk=pk, tags_mask=mask) for pk, mask in masks.items()],
+            ('tags_mask',)
+        )
+
 
 class Tag(models.Model):
     name = models.CharField(max_length=MAX_TAG_LENGTH,
@@ -40,6 +136,20 @@ class Tag(models.Model):
     def __str__(self):
         return self.name[:LENGTH]
 
+    @staticmethod
+    def get_bit(pk):
+        """
+        Бит тега в Recipe.tags_mask.
+
+        Теги с id больше TAG_MASK_BITS в маску не попадают (бит 0),
+        фильтрация по ним идет через подзапрос к таблице связей.
+        """
+        return 1 << (pk - 1) if 0 < pk <= TAG_MASK_BITS else 0
+
+    @property
+    def bit(self):
+        return self.get_bit(self.pk)
+
 
 class Ingredient(models.Model):
     name = models.CharField(max_length=MAX_INGREDIENT_LENGTH,
@@ -61,7 +171,7 @@ class Ingredient(models.Model):
         return self.name[:LENGTH]
 
 
-class Recipe(models.Model):
+class Recipe(PreservedFieldsMixin, models.Model):
     author = models.ForeignKey(User,
                                verbose_name='Автор рецепта',
                                related_name='recipes',
@@ -71,6 +181,9 @@ class Recipe(models.Model):
     text = models.TextField(verbose_name='Описание рецепта')
     image = models.ImageField(upload_to='recipes/images/',
                               verbose_name='Картинка')
+    image_variants = models.JSONField(default=dict, blank=True,
+                                      editable=False,
+                                      verbose_name='Варианты картинки')
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления',
         validators=(MinValueValidator(MIN_COUNT), MaxValueValidator(MAX_COUNT))
@@ -81,17 +194,46 @@ class Recipe(models.Model):
                                          verbose_name='Ингредиенты')
     pub_date = models.DateTimeField(auto_now_add=True,
                                     verbose_name='Дата публикации')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True,
+                                      verbose_name='Дата изменения')
+    search_vector = SearchVectorField(null=True, editable=False,
+                                      verbose_name='Поисковый вектор')
+    tags_mask = models.BigIntegerField(default=0, editable=False,
+                                       verbose_name='Битовая маска тегов')
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Число добавлений в избранное'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Число добавлений в списки покупок'
+    )
 
     objects = RecipeManager()
 
+    preserved_fields = ('tags_mask', 'favorites_count', 'in_carts_count')
+
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(fields=('-pub_date',), name='recipe_pub_date_idx'),
+            models.Index(fields=('author', '-pub_date'),
+                         name='recipe_author_pub_date_idx'),
+            GinIndex(fields=('search_vector',),
+                     name='recipe_search_vector_idx'),
+            GinIndex(fields=('name',), name='recipe_name_trgm_idx',
+                     opclasses=('gin_trgm_ops',)),
+        )
 
     def __str__(self):
         return self.name[:LENGTH]
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Recipe.objects.update_search_vector(self.pk)
+
 
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(Recipe, verbose_name='Рецепт',
@@ -125,6 +267,8 @@ class FavoriteShopping(models.Model):
                              verbose_name='Пользователь')
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
                                verbose_name='Рецепт')
+    created_at = models.DateTimeField(auto_now_add=True,
+                                      verbose_name='Дата добавления')
 
     class Meta:
         abstract = True
@@ -134,6 +278,10 @@ class FavoriteShopping(models.Model):
                 name='unique_%(class)s_recipe_user'
             ),
         )
+        indexes = (
+            models.Index(fields=('created_at',),
+                         name='%(class)s_created_at_idx'),
+        )
 
     def __str__(self):
         return (f'{self._meta.verbose_name}: {self.user} - '
@@ -156,20 +304,115 @@ class ShoppingCart(FavoriteShopping):
         default_related_name = 'shoppingcarts'
 
 
+class ShoppingCartTotal(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             verbose_name='Пользователь',
+                             related_name='shoppingcart_totals')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
+                                   verbose_name='Ингредиент',
+                                   related_name='shoppingcart_totals')
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_user_ingredient'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient}: {self.amount}'
+
+
+class RecipeRanking(models.Model):
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE,
+                                  primary_key=True, related_name='ranking',
+                                  verbose_name='Рецепт')
+    popular = models.FloatField(default=0, verbose_name='Популярность')
+    trending = models.FloatField(default=0, verbose_name='Тренд')
+    computed_at = models.DateTimeField(verbose_name='Дата расчета')
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = (
+            models.Index(fields=('-popular',),
+                         name='recipe_ranking_popular_idx'),
+            models.Index(fields=('-trending',),
+                         name='recipe_ranking_trending_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.recipe}: {self.popular:.2f} / {self.trending:.2f}'
+
+
+class RecipeNeighbor(models.Model):
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='neighbors',
+                               verbose_name='Рецепт')
+    neighbor = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                                 related_name='neighbor_of',
+                                 verbose_name='Похожий рецепт')
+    score = models.FloatField(verbose_name='Сходство')
+    computed_at = models.DateTimeField(verbose_name='Дата расчета')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'neighbor'),
+                name='unique_recipe_neighbor'
+            ),
+        )
+        indexes = (
+            models.Index(fields=('recipe', '-score'),
+                         name='recipe_neighbor_score_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} - {self.neighbor}: {self.score:.2f}'
+
+
 class URL(models.Model):
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE,
+                                  related_name='short_link',
+                                  verbose_name='Рецепт')
     hash = models.SlugField(max_length=MAX_LENGTH, unique=True,
                             verbose_name='Хэш')
-    url = models.URLField(verbose_name='URL')
 
     class Meta:
         verbose_name = 'Ссылка'
         verbose_name_plural = 'Ссылки'
-        constraints = (
-            models.UniqueConstraint(
-                fields=('hash', 'url'),
-                name='unique_hash_url'
-            ),
-        )
 
     def __str__(self):
         return self.hash[:LENGTH]
+
+    def save(self, *args, **kwargs):
+        if not self.hash:
+            self.hash = self.get_hash(self.recipe_id)
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def get_hash(recipe_id):
+        """Хэш короткой ссылки, вычисляемый только из id рецепта."""
+        return short_url.encode_url(recipe_id)
+
+    @staticmethod
+    def get_recipe_id(hash):
+        """
+        Id рецепта по хэшу короткой ссылки без запроса к базе данных.
+
+        Для хэшей, которые не могли быть получены из get_hash,
+        возвращается None.
+        """
+        try:
+            recipe_id = short_url.decode_url(hash)
+        except ValueError:
+            return None
+        if recipe_id < 1 or short_url.encode_url(recipe_id) != hash:
+            return None
+        return recipe_id
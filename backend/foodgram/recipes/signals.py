@@ -0,0 +1,183 @@
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart, Tag)
+from core.cache import invalidate
+from core.images import schedule_variants
+from core.services import (change_counters, finish_cascade, is_cascaded,
+                           start_cascade)
+from users.models import Follow, User
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    """Инвалидация кэша рецептов при изменении рецепта."""
+    invalidate('recipes', f'recipe:{instance.pk}', 'recipe_ingredients')
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def invalidate_recipe_ingredient(sender, instance, **kwargs):
+    """
+    Инвалидация кэша рецептов при сохранении ингредиента рецепта.
+
+    Дата изменения рецепта обновляется, чтобы изменение подхватил
+    индекс ингредиентов (core.matching). API меняет ингредиенты
+    bulk-операциями и затем сохраняет сам рецепт, поэтому сигнал
+    срабатывает только при сохранении отдельных строк (админка).
+    Обработчика удаления нет: строки удаляются вместе с рецептом или
+    ингредиентом одним запросом, а их изменения учитывают сигналы
+    рецепта и touch_ingredient_recipes.
+    """
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        updated_at=timezone.now()
+    )
+    invalidate('recipes', f'recipe:{instance.recipe_id}',
+               'recipe_ingredients')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_recipe_relations(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    """
+    Инвалидация кэша рецептов при изменении связей рецепта.
+
+    При изменении со стороны тега или ингредиента рецепты передаются
+    в pk_set; при clear() со стороны тега их id неизвестны, поэтому
+    сбрасываются версии тегов или ингредиентов целиком.
+    """
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate('recipes', f'recipe:{instance.pk}')
+    elif pk_set:
+        invalidate('recipes', *(f'recipe:{pk}' for pk in pk_set))
+    else:
+        invalidate('recipes', 'tags' if isinstance(instance, Tag)
+                   else 'ingredients')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_tags_mask(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Пересчет Recipe.tags_mask при изменении тегов рецепта.
+
+    Дата изменения рецепта обновляется для пересчета похожих рецептов
+    (core.similarity).
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        Recipe.objects.update_tags_mask(instance.pk)
+        Recipe.objects.filter(pk=instance.pk).update(
+            updated_at=timezone.now()
+        )
+    elif action == 'post_clear':
+        if instance.bit:
+            Recipe.objects.filter(
+                tags_mask=F('tags_mask').bitor(instance.bit)
+            ).update(tags_mask=F('tags_mask').bitand(~instance.bit))
+    elif pk_set:
+        Recipe.objects.update_tags_mask(*pk_set)
+        Recipe.objects.filter(pk__in=pk_set).update(
+            updated_at=timezone.now()
+        )
+
+
+@receiver(post_delete, sender=Tag)
+def clear_tag_bit(sender, instance, **kwargs):
+    """Связи удаленного тега удаляются каскадно, без m2m_changed."""
+    if instance.bit:
+        Recipe.objects.filter(
+            tags_mask=F('tags_mask').bitor(instance.bit)
+        ).update(tags_mask=F('tags_mask').bitand(~instance.bit))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    """Теги входят в ответы о рецептах, поэтому сбрасываются оба кэша."""
+    invalidate('tags', 'recipes')
+
+
+@receiver(pre_delete, sender=Ingredient)
+def touch_ingredient_recipes(sender, instance, **kwargs):
+    """
+    Обновление даты изменения рецептов с удаляемым ингредиентом.
+
+    Строки RecipeIngredient удаляются каскадом без сигналов, поэтому
+    рецепты отмечаются одним запросом до удаления.
+    """
+    Recipe.objects.filter(
+        pk__in=RecipeIngredient.objects.filter(
+            ingredient=instance
+        ).values('recipe_id')
+    ).update(updated_at=timezone.now())
+    invalidate('recipe_ingredients')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    """Ингредиенты входят в ответы о рецептах."""
+    invalidate('ingredients', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_authors(sender, instance, update_fields=None, **kwargs):
+    """
+    Данные автора входят в ответы о рецептах.
+
+    Обновление одного last_login при входе пользователя кэш не сбрасывает.
+    """
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    invalidate('recipes', f'user:{instance.pk}')
+
+
+@receiver(post_save, sender=Recipe)
+def create_recipe_image_variants(sender, instance, **kwargs):
+    """Создание вариантов картинки рецепта после ее изменения."""
+    schedule_variants(instance, 'image')
+
+
+@receiver(post_save, sender=User)
+def create_avatar_variants(sender, instance, **kwargs):
+    """Создание вариантов аватара после его изменения."""
+    schedule_variants(instance, 'avatar')
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=Follow)
+def update_counters(sender, instance, signal, created=False, **kwargs):
+    """
+    Обновление счетчиков рецептов и пользователей.
+
+    bulk_create сигналов не отправляет, поэтому после него счетчики
+    пересчитываются командой reconcile_counters. Строки, удаляемые
+    каскадом вместе с рецептом или пользователем, учитываются
+    сгруппированно в count_cascade_counters.
+    """
+    if signal is post_delete:
+        if not is_cascaded(instance):
+            change_counters(instance, -1)
+    elif created:
+        change_counters(instance, 1)
+
+
+@receiver(pre_delete, sender=Recipe)
+@receiver(pre_delete, sender=User)
+def count_cascade_counters(sender, instance, **kwargs):
+    """Счетчики строк, которые удаляются каскадом вместе с instance."""
+    start_cascade(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def finish_cascade_counters(sender, instance, **kwargs):
+    """Каскадные строки удалены, отметка удаления снимается."""
+    finish_cascade(instance)
@@ -1,13 +1,34 @@
-from django.shortcuts import redirect, get_object_or_404
+from django.conf import settings
+from django.http import Http404
+from django.shortcuts import redirect
+from django.utils.cache import patch_cache_control
 from rest_framework import permissions
 from rest_framework.decorators import api_view, permission_classes
 
 from .models import URL
+from core.concurrency import asgi_view
+from core.constants import RECIPE_PAGE_URL
 
 
+@asgi_view
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def redirect_view(request, slug):
-    """Редирект с короткой ссылки рецепта на обычную."""
-    obj = get_object_or_404(URL, hash=slug)
-    return redirect(obj.url)
+    """
+    Редирект с короткой ссылки рецепта на обычную.
+
+    Id рецепта получается из хэша, без запроса к базе данных. При
+    SHORT_LINK_PERMANENT=True отдается постоянный редирект (301)
+    с Cache-Control, чтобы повторные переходы обслуживали nginx и браузер.
+    """
+    recipe_id = URL.get_recipe_id(slug)
+    if recipe_id is None:
+        raise Http404
+    response = redirect(
+        request.build_absolute_uri(RECIPE_PAGE_URL.format(recipe_id)),
+        permanent=settings.SHORT_LINK_PERMANENT
+    )
+    if settings.SHORT_LINK_PERMANENT:
+        patch_cache_control(response, public=True,
+                            max_age=settings.SHORT_LINK_MAX_AGE)
+    return response
@@ -7,7 +7,7 @@ from .models import Follow, User
 @admin.register(User)
 class UserAdmin(UserAdmin):
     list_display = ('username', 'first_name', 'last_name', 'email',
-                    'is_staff', 'recipes', 'subscriptions_to_author')
+                    'is_staff', 'recipes_count', 'followers_count')
     search_fields = ('username', 'email')
     list_filter = ('is_staff',)
     add_fieldsets = (
@@ -18,14 +18,6 @@ class UserAdmin(UserAdmin):
         }),
     )
 
-    @admin.display(description='Рецепты')
-    def recipes(self, obj):
-        return obj.recipes.count()
-
-    @admin.display(description='Подписчики')
-    def subscriptions_to_author(self, obj):
-        return obj.subscriptions_to_author.count()
-
 
 @admin.register(Follow)
 class FollowAdmin(admin.ModelAdmin):
@@ -3,10 +3,11 @@ from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 
 from core.constants import EMAIL_LENGTH, USER_FIELDS_LENGTH, LENGTH
+from core.mixins import PreservedFieldsMixin
 from core.validators import validate_username
 
 
-class User(AbstractUser):
+class User(PreservedFieldsMixin, AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
 
@@ -21,6 +22,16 @@ class User(AbstractUser):
                               verbose_name='Email')
     avatar = models.ImageField(upload_to='users/', blank=True, null=True,
                                verbose_name='Аватар')
+    avatar_variants = models.JSONField(default=dict, blank=True,
+                                       editable=False,
+                                       verbose_name='Варианты аватара')
+    recipes_count = models.PositiveIntegerField(default=0, editable=False,
+                                                verbose_name='Число рецептов')
+    followers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Число подписчиков'
+    )
+
+    preserved_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         verbose_name = 'Пользователь'